@@ -0,0 +1,256 @@
+"""
+HTTP benchmarks for jungmarker_site.py.
+
+Starts the site in a subprocess on a free local port, in either serving
+mode (``dev``: the threaded Werkzeug server, ``serve``: the pre-forking
+server), drives each scenario with ``--concurrency`` keep-alive clients for
+``--duration`` seconds, and reports requests per second, p50/p95/p99
+latency and bytes per response.
+
+    python benchmarks/bench_site.py --out benchmarks/results/run.json
+    python benchmarks/bench_site.py --mode serve --workers 4 --baseline benchmarks/baseline.json
+    python benchmarks/bench_site.py --save-baseline benchmarks/baseline.json
+
+With ``--baseline`` the run fails (exit status 1) if any scenario's RPS
+dropped, or its p95 rose, by more than ``--threshold`` (default 10%).
+
+The server gets a throwaway lead database, no notification credentials and
+no contact-form rate limit, so /contact measures the request path only.
+"""
+
+import argparse
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (method, path, body factory or None)
+SCENARIOS = {
+    "index": ("GET", "/", None),
+    "listings": ("GET", "/api/listings?status=sold&sort=-price&limit=24", None),
+    "suggest": ("GET", "/api/listings/suggest?q=balt&limit=8", None),
+    "stats": ("GET", "/api/stats", None),
+    "cma": ("GET", "/api/cma?zip=21211&sqft=1400&beds=3&baths=2", None),
+    "contact": ("POST", "/contact", lambda n: json.dumps({
+        "first_name": "Bench",
+        "last_name": f"Mark{n}",
+        "email": f"bench{n}@example.com",
+        "phone": "",
+        "interest": "buy",
+        "message": f"benchmark request {n}",
+    }).encode()),
+}
+
+# Variables that would make /contact send real email, SMS or CRM records.
+NOTIFY_ENV = (
+    "GMAIL_USER", "SMTP_HOST", "TWILIO_ACCOUNT_SID", "AIRTABLE_TOKEN",
+)
+
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    bytes_per_response: float
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return math.nan
+    pos = q * (len(sorted_values) - 1)
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, workers, tmp):
+    env = dict(os.environ, SITE_PORT=str(port), LEADS_DB=os.path.join(tmp, "leads.db"),
+               NOTIFY_DEAD_LETTER=os.path.join(tmp, "dead-letter.jsonl"),
+               CONTACT_RATE_PER_MIN="1e9", CONTACT_BURST="1000000000")
+    for name in NOTIFY_ENV:
+        env.pop(name, None)
+    cmd = [sys.executable, os.path.join(REPO, "jungmarker_site.py"), mode]
+    if mode == "serve":
+        cmd += ["--host", "127.0.0.1", "--workers", str(workers), "--max-requests", "0"]
+    log_path = os.path.join(tmp, "server.log")
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=REPO, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            with open(log_path, errors="replace") as f:
+                tail = f.read()[-2000:]
+            raise RuntimeError(f"server exited with status {proc.returncode}:\n{tail}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not start within 30s")
+
+
+def run_scenario(name, port, concurrency, duration, warmup, encoding):
+    method, path, make_body = SCENARIOS[name]
+    counter = itertools.count()
+    stop = threading.Event()
+    measuring = threading.Event()
+    samples = [[] for _ in range(concurrency)]  # (latency, bytes) per client
+    errors = [0] * concurrency
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    if make_body:
+        headers["Content-Type"] = "application/json"
+
+    def client(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine = samples[i]
+        while not stop.is_set():
+            body = make_body(next(counter)) if make_body else None
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                ok = resp.status < 400
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                data, ok = b"", False
+            elapsed = time.perf_counter() - start
+            if measuring.is_set():
+                if ok:
+                    mine.append((elapsed, len(data)))
+                else:
+                    errors[i] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(warmup)
+    measuring.set()
+    began = time.perf_counter()
+    time.sleep(duration)
+    measuring.clear()
+    elapsed = time.perf_counter() - began
+    stop.set()
+    for t in threads:
+        t.join()
+
+    merged = [s for per_client in samples for s in per_client]
+    latencies = sorted(lat for lat, _ in merged)
+    return Result(
+        scenario=name,
+        requests=len(merged),
+        errors=sum(errors),
+        rps=round(len(merged) / elapsed, 1),
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        bytes_per_response=round(sum(n for _, n in merged) / len(merged), 1) if merged else 0.0,
+    )
+
+
+def compare(results, baseline, threshold):
+    """Lines describing regressions against ``baseline`` beyond ``threshold``."""
+    before = {r["scenario"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = before.get(r.scenario)
+        if old is None:
+            continue
+        if r.rps < old["rps"] * (1 - threshold):
+            regressions.append(f"{r.scenario}: rps {old['rps']} -> {r.rps}")
+        if r.p95_ms > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{r.scenario}: p95 {old['p95_ms']}ms -> {r.p95_ms}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench_site.py")
+    parser.add_argument("--mode", choices=("dev", "serve"), default="dev")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes in serve mode")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per scenario")
+    parser.add_argument("--encoding", default="br, gzip", help="Accept-Encoding sent ('' for none)")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--save-baseline", metavar="PATH", help="also write results as the baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against this results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed fractional RPS drop / p95 rise (default 0.10)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = start_server(args.mode, port, args.workers, tmp)
+        try:
+            results = []
+            for name in names:
+                r = run_scenario(name, port, args.concurrency, args.duration, args.warmup, args.encoding)
+                results.append(r)
+                print(f"  {r.scenario:<10} {r.rps:>9.1f} req/s  p50 {r.p50_ms:>7.2f}ms  "
+                      f"p95 {r.p95_ms:>7.2f}ms  p99 {r.p99_ms:>7.2f}ms  "
+                      f"{r.bytes_per_response:>9.0f} B/resp  {r.errors} errors")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: getattr(args, k) for k in ("mode", "workers", "concurrency", "duration", "warmup", "encoding")},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": [asdict(r) for r in results],
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("  REGRESSIONS:")
+            for line in regressions:
+                print(f"    {line}")
+            return 1
+        print(f"  no regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
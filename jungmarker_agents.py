@@ -0,0 +1,142 @@
+"""
+Per-agent site configuration for multi-agent hosting.
+
+Each agent is one JSON file in the agents directory (``agents/<slug>.json``)
+holding everything agent-specific on the page: name, contact details,
+hero stats, credentials, testimonials, service areas, which listings file
+to show, and the ``hosts`` (domains) that serve it. A request is matched to
+an agent by its ``Host`` header. Unknown hosts get the default agent.
+
+``AgentRegistry`` re-scans the directory at most once per
+``check_interval`` and reloads only the files whose mtime or size changed.
+A file that fails to parse keeps its last good version. Every ``Agent``
+carries a ``version`` hash of its file, which render caches key on.
+"""
+
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Agent:
+    slug: str
+    version: str        # hash of the config file's bytes
+    hosts: tuple
+    listings_path: str
+    config: dict
+
+    def __getattr__(self, name):
+        # Template convenience: {{ agent.phone }} reads the config.
+        try:
+            return self.config[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def notify_fields(self) -> dict:
+        """What lead notifications need to speak for this agent."""
+        return {
+            "agent": self.slug,
+            "agent_name": self.config["name"],
+            "agent_role": self.config.get("role", "REALTOR®"),
+            "agent_email": self.config.get("notify_email") or self.config["email"],
+            "agent_phone": self.config.get("sms_phone") or self.config["phone"],
+            "agent_site": self.hosts[0] if self.hosts else "",
+        }
+
+
+def load_agent(path: str, data: bytes, base_dir: str, default_listings: str) -> Agent:
+    """Parse one agent file. Raises ValueError on bad JSON or missing fields."""
+    config = json.loads(data)
+    for key in ("name", "first_name", "phone", "email"):
+        if not config.get(key):
+            raise ValueError(f"{path}: missing {key!r}")
+    slug = os.path.splitext(os.path.basename(path))[0]
+    listings = config.get("listings") or default_listings
+    return Agent(
+        slug=slug,
+        version=hashlib.sha256(data).hexdigest()[:16],
+        hosts=tuple(h.lower() for h in config.get("hosts", ())),
+        listings_path=os.path.normpath(os.path.join(base_dir, listings)),
+        config=config,
+    )
+
+
+class AgentRegistry:
+    """Hot-reloading map of hostname -> ``Agent``."""
+
+    def __init__(self, directory: str, base_dir: str, default: str = None,
+                 default_listings: str = "public/listings.json", check_interval: float = 1.0):
+        self.directory = directory
+        self.base_dir = base_dir  # listings paths are relative to this
+        self.default_slug = default
+        self.default_listings = default_listings  # for configs that don't name one
+        self.check_interval = check_interval
+        self._files = {}    # file name -> (mtime_ns, size, Agent)
+        self._hosts = {}
+        self._agents = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if time.monotonic() - self._checked < self.check_interval and self._agents:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked < self.check_interval and self._agents:
+                return
+            self._checked = time.monotonic()
+            files = {}
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    old = self._files.get(entry.name)
+                    if old and old[:2] == (st.st_mtime_ns, st.st_size):
+                        files[entry.name] = old
+                        continue
+                    try:
+                        with open(entry.path, "rb") as f:
+                            agent = load_agent(
+                                entry.path, f.read(), self.base_dir, self.default_listings,
+                            )
+                        files[entry.name] = (st.st_mtime_ns, st.st_size, agent)
+                    except (OSError, ValueError):
+                        log.exception("could not load agent config %s", entry.path)
+                        if old:
+                            files[entry.name] = old
+            if files.keys() == self._files.keys() and all(
+                files[k] is self._files[k] for k in files
+            ):
+                return
+            agents = {a.slug: a for _, _, a in files.values()}
+            if not agents:
+                raise RuntimeError(f"no agent configs in {self.directory}")
+            hosts = {}
+            for agent in agents.values():
+                for host in agent.hosts:
+                    hosts[host] = agent
+            self._files, self._agents, self._hosts = files, agents, hosts
+
+    def agents(self) -> dict:
+        self._refresh()
+        return self._agents
+
+    def default(self) -> Agent:
+        agents = self.agents()
+        return agents.get(self.default_slug) or agents[min(agents)]
+
+    def for_host(self, host: str) -> Agent:
+        """The agent serving ``host`` (port and a leading ``www.`` ignored)."""
+        self._refresh()
+        host = (host or "").lower()
+        if not host.endswith("]"):  # keep IPv6 literals whole
+            host = host.rsplit(":", 1)[0]
+        agent = self._hosts.get(host) or self._hosts.get(host.removeprefix("www."))
+        return agent or self.default()
@@ -0,0 +1,281 @@
+"""
+Comparable-sales (CMA) estimates from the sold listings in listings.json.
+
+Every sold listing with a location is a comp. The location is the
+listing's own ``lat``/``lng`` when the file has them, otherwise the centroid
+of the ZIP code in its ``city`` ("Baltimore, MD 21211"). Comps are projected
+to kilometres and bucketed into a uniform grid, so a query only visits the
+cells around the subject, ring by ring, until nothing further out could be
+nearer than what it already has.
+
+Those candidates are scored in one vectorised pass on distance, size, beds,
+baths and age of sale, and the ``k`` best are the comps. Each comp's price
+is scaled to the subject's square footage when both are known. The estimate
+is the similarity-weighted median of those prices, and the range is the
+weighted 20th–80th percentile. ``CompCache`` rebuilds the index only when
+the listings snapshot changes.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+import math
+import threading
+
+import numpy as np
+
+from jungmarker_listings import zip_of
+
+# Approximate ZIP centroids (lat, lng) for the areas the site covers. Comps
+# and subjects elsewhere need explicit coordinates.
+ZIP_CENTROIDS = {
+    # Baltimore City
+    "21201": (39.2946, -76.6252), "21202": (39.2965, -76.6078), "21205": (39.3026, -76.5643),
+    "21206": (39.3384, -76.5388), "21209": (39.3714, -76.6742), "21210": (39.3574, -76.6364),
+    "21211": (39.3290, -76.6390), "21212": (39.3680, -76.6150), "21213": (39.3146, -76.5773),
+    "21214": (39.3521, -76.5644), "21215": (39.3450, -76.6830), "21216": (39.3094, -76.6693),
+    "21217": (39.3088, -76.6394), "21218": (39.3300, -76.6010), "21223": (39.2830, -76.6540),
+    "21224": (39.2760, -76.5560), "21225": (39.2260, -76.6150), "21229": (39.2856, -76.6901),
+    "21230": (39.2701, -76.6236), "21231": (39.2879, -76.5920), "21239": (39.3670, -76.5890),
+    # Baltimore County
+    "21093": (39.4380, -76.6400), "21117": (39.4260, -76.7790), "21204": (39.4081, -76.6020),
+    "21208": (39.3840, -76.7270), "21221": (39.2980, -76.4470), "21228": (39.2740, -76.7400),
+    "21234": (39.3930, -76.5390), "21236": (39.3900, -76.4850), "21286": (39.4140, -76.5760),
+    # Howard County
+    "21042": (39.2730, -76.8610), "21043": (39.2540, -76.7990), "21044": (39.2140, -76.8780),
+    "21045": (39.2050, -76.8310), "21046": (39.1740, -76.8400),
+    # Harford County
+    "21009": (39.4710, -76.3000), "21014": (39.5370, -76.3470), "21015": (39.4960, -76.3130),
+    # Anne Arundel County
+    "21061": (39.1610, -76.6290), "21122": (39.1210, -76.4960), "21146": (39.0770, -76.5570),
+    "21401": (38.9890, -76.5480), "21403": (38.9450, -76.4890),
+    # Prince George's, Montgomery and Frederick Counties
+    "20715": (38.9880, -76.7400), "20782": (38.9650, -76.9650), "20783": (39.0000, -76.9700),
+    "20904": (39.0660, -76.9750), "21701": (39.4400, -77.3700),
+}
+
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LNG_AT_EQUATOR = 111.32
+CELL_KM = 2.0
+MAX_RADIUS_KM = 40.0
+# Spatial candidates scored per query: k times this, but at least MIN_CANDIDATES.
+CANDIDATES_PER_COMP = 4
+MIN_CANDIDATES = 32
+MAX_K = 20
+
+# Similarity score terms; lower is more similar. Distance counts one point
+# per DISTANCE_SCALE_KM, size one point per SQFT_WEIGHT-th of log ratio, and
+# so on. A comp missing an attribute the subject has pays MISSING_PENALTY.
+DISTANCE_SCALE_KM = 2.0
+SQFT_WEIGHT = 2.0
+ROOM_WEIGHT = 0.35     # per bedroom / bathroom of difference
+AGE_WEIGHT = 1 / 12    # per month since the sale
+UNDATED_AGE_MONTHS = 12
+MISSING_PENALTY = 0.5
+# Keeps a near-identical comp from taking all of the weight.
+SCORE_FLOOR = 0.25
+RANGE_QUANTILES = (0.2, 0.5, 0.8)
+
+
+def locate(listing):
+    """``(lat, lng)`` of a listing, from its geocode or its ZIP; else None."""
+    if listing.lat and listing.lng:
+        return listing.lat, listing.lng
+    return ZIP_CENTROIDS.get(zip_of(listing.city))
+
+
+def resolve_subject(zip_code="", address="", lat=None, lng=None):
+    """``(lat, lng, zip)`` for a CMA subject. Raises ValueError if it can't
+    be placed."""
+    zip_code = zip_code or zip_of(address)
+    if lat is not None and lng is not None:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError("lat/lng out of range")
+        return lat, lng, zip_code
+    if not zip_code:
+        raise ValueError("give a zip, an address with a ZIP code, or lat and lng")
+    if zip_code not in ZIP_CENTROIDS:
+        raise ValueError(f"no location for ZIP {zip_code}; give lat and lng")
+    return (*ZIP_CENTROIDS[zip_code], zip_code)
+
+
+def _month_index(iso: str) -> float:
+    if not iso:
+        return math.nan
+    return int(iso[:4]) * 12 + int(iso[5:7]) - 1
+
+
+def _normalize_address(address: str) -> str:
+    return " ".join(address.lower().split())
+
+
+def weighted_quantiles(values, weights, qs):
+    """Quantiles of ``values`` where each value counts ``weights`` times."""
+    order = np.argsort(values, kind="stable")
+    v, w = values[order], weights[order]
+    cum = (np.cumsum(w) - 0.5 * w) / w.sum()
+    return np.interp(qs, cum, v)
+
+
+@dataclass(frozen=True)
+class Comp:
+    listing: object
+    distance_km: float
+    score: float
+    adjusted_price: float
+
+
+@dataclass(frozen=True)
+class Estimate:
+    estimate: float
+    low: float
+    high: float
+    comps: list
+
+
+class CompIndex:
+    """Sold comps in a uniform grid over a local kilometre projection."""
+
+    def __init__(self, listings):
+        located = [
+            (l, loc) for l in listings
+            if l.status == "sold" and l.price > 0 and (loc := locate(l))
+        ]
+        lat = np.array([loc[0] for _, loc in located], dtype=float)
+        lng = np.array([loc[1] for _, loc in located], dtype=float)
+        self.ref_lat = float(lat.mean()) if len(lat) else 39.0
+        self._km_per_deg_lng = KM_PER_DEG_LNG_AT_EQUATOR * math.cos(math.radians(self.ref_lat))
+        x, y = self.project(lat, lng)
+        cx = np.floor(x / CELL_KM).astype(np.int64)
+        cy = np.floor(y / CELL_KM).astype(np.int64)
+
+        # Sort comps by cell so each cell is one contiguous slice.
+        order = np.lexsort((cy, cx))
+        self.comps = tuple(located[i][0] for i in order)
+        self.x, self.y = x[order], y[order]
+        cx, cy = cx[order], cy[order]
+        comps = self.comps
+        self.price = np.array([l.price for l in comps], dtype=float)
+        self.sqft = np.array([l.sqft or np.nan for l in comps], dtype=float)
+        self.beds = np.array([l.beds or np.nan for l in comps], dtype=float)
+        self.baths = np.array([l.baths or np.nan for l in comps], dtype=float)
+        self.month = np.array([_month_index(l.date) for l in comps], dtype=float)
+        self.address = np.array([_normalize_address(l.address) for l in comps], dtype=object)
+
+        self.cells = {}  # (cx, cy) -> (start, stop)
+        if len(comps):
+            starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+            stops = np.r_[starts[1:], len(comps)]
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                self.cells[(int(cx[start]), int(cy[start]))] = (start, stop)
+
+    def __len__(self):
+        return len(self.comps)
+
+    def project(self, lat, lng):
+        return np.asarray(lng) * self._km_per_deg_lng, np.asarray(lat) * KM_PER_DEG_LAT
+
+    def nearby(self, x: float, y: float, want: int):
+        """Indices and distances of the ``want`` comps nearest ``(x, y)``
+        within ``MAX_RADIUS_KM`` (fewer if there aren't that many)."""
+        cx, cy = math.floor(x / CELL_KM), math.floor(y / CELL_KM)
+        spans, found = [], 0
+        idx = np.empty(0, dtype=np.intp)
+        for ring in range(math.ceil(MAX_RADIUS_KM / CELL_KM) + 1):
+            for cell in _ring_cells(cx, cy, ring):
+                span = self.cells.get(cell)
+                if span is not None:
+                    spans.append(span)
+                    found += span[1] - span[0]
+            if found >= want:
+                idx = np.concatenate([np.arange(a, b) for a, b in spans])
+                dist = np.hypot(self.x[idx] - x, self.y[idx] - y)
+                # Anything outside rings 0..ring is at least ring * CELL_KM away.
+                if np.count_nonzero(dist <= ring * CELL_KM) >= want:
+                    break
+        else:
+            if spans:
+                idx = np.concatenate([np.arange(a, b) for a, b in spans])
+        dist = np.hypot(self.x[idx] - x, self.y[idx] - y)
+        keep = dist <= MAX_RADIUS_KM
+        idx, dist = idx[keep], dist[keep]
+        if len(idx) > want:
+            part = np.argpartition(dist, want - 1)[:want]
+            idx, dist = idx[part], dist[part]
+        return idx, dist
+
+    def estimate(self, lat: float, lng: float, sqft=0, beds=0.0, baths=0.0,
+                 k=5, exclude_address="", today=None):
+        """The ``k`` most similar comps and the estimate they imply, or None
+        when no comp lies within ``MAX_RADIUS_KM``."""
+        k = max(1, min(int(k), MAX_K))
+        x, y = self.project(lat, lng)
+        idx, dist = self.nearby(float(x), float(y), max(k * CANDIDATES_PER_COMP, MIN_CANDIDATES))
+        if exclude_address:
+            keep = self.address[idx] != _normalize_address(exclude_address)
+            idx, dist = idx[keep], dist[keep]
+        if not len(idx):
+            return None
+
+        today = today or date.today()
+        score = dist / DISTANCE_SCALE_KM
+        score += _attribute_term(self.sqft[idx], sqft, lambda c, s: SQFT_WEIGHT * np.abs(np.log(c / s)))
+        score += _attribute_term(self.beds[idx], beds, lambda c, s: ROOM_WEIGHT * np.abs(c - s))
+        score += _attribute_term(self.baths[idx], baths, lambda c, s: ROOM_WEIGHT * np.abs(c - s))
+        age = (today.year * 12 + today.month - 1) - self.month[idx]
+        score += AGE_WEIGHT * np.clip(np.nan_to_num(age, nan=UNDATED_AGE_MONTHS), 0, None)
+
+        if len(idx) > k:
+            best = np.argpartition(score, k - 1)[:k]
+            idx, dist, score = idx[best], dist[best], score[best]
+        order = np.argsort(score, kind="stable")
+        idx, dist, score = idx[order], dist[order], score[order]
+
+        price = self.price[idx]
+        if sqft:
+            comp_sqft = self.sqft[idx]
+            price = np.where(np.isnan(comp_sqft), price, price / comp_sqft * sqft)
+        low, mid, high = weighted_quantiles(price, 1 / (score + SCORE_FLOOR), RANGE_QUANTILES)
+        comps = [
+            Comp(self.comps[i], d, s, p)
+            for i, d, s, p in zip(idx.tolist(), dist.tolist(), score.tolist(), price.tolist())
+        ]
+        return Estimate(float(mid), float(low), float(high), comps)
+
+
+def _attribute_term(comp_values, subject, diff):
+    """``diff`` where both sides are known; a flat penalty where only the
+    subject is; nothing when the subject didn't give the attribute."""
+    if not subject:
+        return 0.0
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isnan(comp_values), MISSING_PENALTY, diff(comp_values, float(subject)))
+
+
+def _ring_cells(cx, cy, ring):
+    """Grid cells at Chebyshev distance exactly ``ring`` from ``(cx, cy)``."""
+    if ring == 0:
+        yield cx, cy
+        return
+    for dx in range(-ring, ring + 1):
+        yield cx + dx, cy - ring
+        yield cx + dx, cy + ring
+    for dy in range(-ring + 1, ring):
+        yield cx - ring, cy + dy
+        yield cx + ring, cy + dy
+
+
+class CompCache:
+    """The comp index of the current listings snapshot, built once per version."""
+
+    def __init__(self):
+        self._version = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self, snap) -> CompIndex:
+        if self._version != snap.etag:
+            with self._lock:
+                if self._version != snap.etag:
+                    self._index = CompIndex(snap.listings)
+                    self._version = snap.etag
+        return self._index
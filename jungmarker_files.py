@@ -0,0 +1,175 @@
+"""
+Plain files from public/ (logos, robots.txt, sitemap.xml, listings.json...).
+
+Every file's metadata and content-hash ETag is computed once per version
+(mtime and size) and reused until the file changes. Small files also keep
+their bytes in a size-bounded LRU, so the hot ones are served without
+touching the disk beyond one ``stat``. Larger files are streamed from disk.
+When the server exposes its socket (Werkzeug's servers, including ``serve``),
+the body is handed to ``socket.sendfile`` so the kernel copies it.
+
+Conditional GETs and byte ranges both go through Werkzeug's
+``make_conditional``, so ``If-None-Match``, ``If-Modified-Since``, ``Range``
+and ``If-Range`` all behave as they do for Flask's own ``send_file``.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response
+from werkzeug.security import safe_join
+
+# Files up to this size are kept in memory...
+MAX_CACHED_FILE = 256 * 1024
+# ...within this total.
+MAX_CACHE_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class FileVersion:
+    path: str
+    mtime_ns: int
+    size: int
+    etag: str
+    mimetype: str
+
+    @property
+    def last_modified(self) -> datetime:
+        return datetime.fromtimestamp(self.mtime_ns // 1_000_000_000, timezone.utc)
+
+
+class _FileBody:
+    """A byte range of a file as a WSGI body, sent with sendfile if possible."""
+
+    def __init__(self, path, offset, length, sock=None):
+        self.path, self.offset, self.length, self.sock = path, offset, length, sock
+        self._file = None
+
+    def __iter__(self):
+        self._file = f = open(self.path, "rb")
+        if self.sock is not None:
+            # An empty chunk makes Werkzeug send the headers; then the
+            # kernel copies the body straight from the page cache.
+            yield b""
+            sent = 0
+            while sent < self.length:
+                n = self.sock.sendfile(f, self.offset + sent, self.length - sent)
+                if not n:
+                    break
+                sent += n
+            return
+        f.seek(self.offset)
+        remaining = self.length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class PublicFiles:
+    def __init__(self, root: str, cache_control: str,
+                 max_cached_file=MAX_CACHED_FILE, max_cache_bytes=MAX_CACHE_BYTES):
+        self.root = os.path.realpath(root)
+        self.cache_control = cache_control
+        self.max_cached_file = max_cached_file
+        self.max_cache_bytes = max_cache_bytes
+        self._versions = {}           # path -> FileVersion
+        self._bodies = OrderedDict()  # (path, mtime_ns, size) -> bytes, LRU
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, name: str):
+        """The current ``FileVersion`` of ``name``, or None if it isn't a file."""
+        path = safe_join(self.root, name)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path) or not os.path.realpath(path).startswith(self.root + os.sep):
+            return None
+        version = self._versions.get(path)
+        if version is not None and (version.mtime_ns, version.size) == (st.st_mtime_ns, st.st_size):
+            return version
+        body = self._read_body(path, st) if st.st_size <= self.max_cached_file else None
+        etag = hashlib.sha256(body).hexdigest() if body is not None else _hash_file(path)
+        version = FileVersion(
+            path=path,
+            mtime_ns=st.st_mtime_ns,
+            size=st.st_size,
+            etag=etag[:32],
+            mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        )
+        self._versions[path] = version
+        return version
+
+    def _read_body(self, path, st):
+        with open(path, "rb") as f:
+            body = f.read()
+        self._remember((path, st.st_mtime_ns, st.st_size), body)
+        return body
+
+    def _remember(self, key, body):
+        with self._lock:
+            if key in self._bodies:
+                return
+            self._bodies[key] = body
+            self._cached_bytes += len(body)
+            while self._cached_bytes > self.max_cache_bytes:
+                _, old = self._bodies.popitem(last=False)
+                self._cached_bytes -= len(old)
+
+    def _cached(self, version: FileVersion):
+        key = (version.path, version.mtime_ns, version.size)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+        if body is None and version.size <= self.max_cached_file:
+            # Evicted from the LRU since lookup(); read it back in.
+            with open(version.path, "rb") as f:
+                body = f.read()
+            if len(body) != version.size:
+                return None  # changed under us; stream it this time
+            self._remember(key, body)
+        return body
+
+    def response(self, version: FileVersion, request) -> Response:
+        body = self._cached(version)
+        resp = Response(body if body is not None else b"", mimetype=version.mimetype)
+        resp.set_etag(version.etag)
+        resp.last_modified = version.last_modified
+        resp.headers["Cache-Control"] = self.cache_control
+        resp.make_conditional(request.environ, accept_ranges=True, complete_length=version.size)
+        if body is None and resp.status_code in (200, 206):
+            if resp.status_code == 206:
+                start, stop = resp.content_range.start, resp.content_range.stop
+            else:
+                start, stop = 0, version.size
+            resp.response = _FileBody(
+                version.path, start, stop - start, request.environ.get("werkzeug.socket"),
+            )
+            resp.content_length = stop - start
+            resp.direct_passthrough = True
+        return resp
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
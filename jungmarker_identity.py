@@ -0,0 +1,212 @@
+"""
+Lead identity resolution: one ``people`` row per prospect, however many
+times and however differently they fill in the form.
+
+Every submission is normalised (canonical email, 10-digit phone, folded
+names, ZIP) and looked up under its blocking keys:
+
+  p:<phone>            normalised phone number
+  e:<email>            canonical email address
+  l:<local part>       email local part, so jsmith@gmail.com meets jsmith@work.com
+  n:<last name>|<ZIP>  last name plus ZIP code
+
+``person_keys`` maps each key to the people filed under it. It is a
+``WITHOUT ROWID`` table clustered on the key, so a lookup is one index seek
+however large the table grows. Candidates found by phone or email match
+outright. Weaker keys need a second signal: the same last name for an email
+local part, and a compatible first name for last name plus ZIP. If a
+submission matches several people, they are merged into the oldest.
+
+Resolution runs inside the lead writer's ``BEGIN IMMEDIATE`` transaction,
+so the SQLite write lock orders concurrent ``serve`` workers. Every
+submission stays in ``leads`` with its ``person_id``, which is that
+person's history.
+"""
+
+import re
+import unicodedata
+
+from jungmarker_listings import zip_of
+
+# A key shared by more people than this stops being useful for blocking.
+MAX_BLOCK = 50
+# Local parts too generic to say anything about who wrote in.
+GENERIC_LOCAL_PARTS = frozenset({
+    "admin", "contact", "hello", "hi", "home", "info", "mail", "me", "office",
+    "realestate", "sales", "support", "test",
+})
+_GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+_EXTENSION_RE = re.compile(r"\s*(?:ext\.?|extension|x|#)\s*\d+\s*$", re.I)
+_NOT_LETTER_RE = re.compile(r"[^a-z]")
+
+
+# ── Normalisation ────────────────────────────────────────────────────────────
+
+def email_key(email: str) -> str:
+    """Lowercased, without a ``+tag``; Gmail addresses also without dots."""
+    email = email.strip().lower()
+    local, at, domain = email.rpartition("@")
+    if not at or not local:
+        return email
+    local = local.split("+", 1)[0]
+    if domain in _GMAIL_DOMAINS:
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}"
+
+
+def phone_key(phone: str) -> str:
+    """Digits only, without a leading US country code or an extension."""
+    digits = "".join(c for c in _EXTENSION_RE.sub("", phone) if c.isdigit())
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+
+def name_key(name: str) -> str:
+    """ASCII letters only, lowercased: "O'Brien-José" -> "obrienjose"."""
+    folded = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return _NOT_LETTER_RE.sub("", folded.lower())
+
+
+def lead_zip(lead: dict) -> str:
+    """The lead's ZIP field, or failing that a ZIP code in their message."""
+    return zip_of(lead.get("zip", "")) or zip_of(lead.get("message", ""))
+
+
+def blocking_keys(lead: dict):
+    """The lookup keys of a submission, strongest first."""
+    keys = []
+    phone = phone_key(lead.get("phone", ""))
+    if len(phone) == 10:
+        keys.append(f"p:{phone}")
+    email = email_key(lead.get("email", ""))
+    local, at, _ = email.partition("@")
+    if at and local:
+        keys.append(f"e:{email}")
+        if len(local) >= 3 and local not in GENERIC_LOCAL_PARTS:
+            keys.append(f"l:{local}")
+    last, zip_code = name_key(lead.get("last_name", "")), lead_zip(lead)
+    if last and zip_code:
+        keys.append(f"n:{last}|{zip_code}")
+    return keys
+
+
+def _first_names_agree(a: str, b: str) -> bool:
+    # "jon" / "jonathan", "liz" / "elizabeth" is beyond us.
+    return bool(a and b) and (a.startswith(b) or b.startswith(a))
+
+
+def _confirms(kind: str, lead: dict, person) -> bool:
+    if kind in ("p", "e"):
+        return True
+    if kind == "l":
+        last = name_key(lead.get("last_name", ""))
+        return bool(last) and last == name_key(person["last_name"])
+    return _first_names_agree(name_key(lead.get("first_name", "")), name_key(person["first_name"]))
+
+
+# ── Resolution ───────────────────────────────────────────────────────────────
+
+def resolve(conn, lead: dict, created_at: str) -> int:
+    """File ``lead`` under an existing or new person and return its id.
+
+    Must run inside the caller's write transaction.
+    """
+    keys = blocking_keys(lead)
+    kinds = {}  # candidate person id -> strongest key kind it was found by
+    for key in keys:
+        block = conn.execute(
+            "SELECT person_id FROM person_keys WHERE key = ? LIMIT ?", (key, MAX_BLOCK + 1)
+        ).fetchall()
+        if len(block) > MAX_BLOCK:
+            continue  # a common name or local part; the other keys decide
+        for (person_id,) in block:
+            kinds.setdefault(person_id, key[0])
+    matches = []
+    if kinds:
+        ids = list(kinds)
+        people = conn.execute(
+            f"SELECT id, first_name, last_name FROM people WHERE id IN ({', '.join('?' * len(ids))})",
+            ids,
+        )
+        matches = sorted(p["id"] for p in people if _confirms(kinds[p["id"]], lead, p))
+
+    if matches:
+        person_id = matches[0]
+        for other in matches[1:]:
+            merge_people(conn, person_id, other)
+    else:
+        person_id = conn.execute(
+            "INSERT INTO people (first_seen, last_seen) VALUES (?, ?)", (created_at, created_at)
+        ).lastrowid
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO person_keys (key, person_id) VALUES (?, ?)",
+        [(key, person_id) for key in keys],
+    )
+    conn.execute(
+        """
+        UPDATE people SET
+            last_seen   = MAX(last_seen, :created_at),
+            submissions = submissions + 1,
+            first_name  = COALESCE(NULLIF(:first_name, ''), first_name),
+            last_name   = COALESCE(NULLIF(:last_name, ''), last_name),
+            email       = COALESCE(NULLIF(:email, ''), email),
+            phone       = COALESCE(NULLIF(:phone, ''), phone),
+            zip         = COALESCE(NULLIF(:zip, ''), zip)
+        WHERE id = :id
+        """,
+        {
+            "id": person_id,
+            "created_at": created_at,
+            "first_name": lead.get("first_name", ""),
+            "last_name": lead.get("last_name", ""),
+            "email": lead.get("email", ""),
+            "phone": lead.get("phone", ""),
+            "zip": lead_zip(lead),
+        },
+    )
+    return person_id
+
+
+def merge_people(conn, keep: int, other: int):
+    """Fold person ``other`` into ``keep``: their submissions, keys and counts."""
+    conn.execute("UPDATE leads SET person_id = ? WHERE person_id = ?", (keep, other))
+    conn.execute(
+        "INSERT OR IGNORE INTO person_keys (key, person_id) "
+        "SELECT key, ? FROM person_keys WHERE person_id = ?",
+        (keep, other),
+    )
+    conn.execute("DELETE FROM person_keys WHERE person_id = ?", (other,))
+    conn.execute(
+        """
+        UPDATE people SET
+            first_seen  = MIN(first_seen, (SELECT first_seen FROM people WHERE id = :other)),
+            submissions = submissions + (SELECT submissions FROM people WHERE id = :other)
+        WHERE id = :keep
+        """,
+        {"keep": keep, "other": other},
+    )
+    conn.execute("DELETE FROM people WHERE id = ?", (other,))
+
+
+def backfill(conn, batch_size: int = 1000) -> int:
+    """Resolve leads stored before identity resolution existed, a batch per
+    transaction. Returns how many were resolved."""
+    done = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM leads WHERE person_id IS NULL ORDER BY id LIMIT ?", (batch_size,)
+            ).fetchall()
+            for row in rows:
+                person_id = resolve(conn, dict(row), row["created_at"])
+                conn.execute("UPDATE leads SET person_id = ? WHERE id = ?", (person_id, row["id"]))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        done += len(rows)
+        if len(rows) < batch_size:
+            return done
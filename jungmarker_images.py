@@ -0,0 +1,137 @@
+"""
+Resized, re-encoded variants of the raster images under public/.
+
+``/img/<name>?w=<width>&fm=webp|jpg`` snaps the width up to one of
+``WIDTHS`` (never past the source's own width), encodes that variant once
+and keeps it in a disk cache named after the source's version. The
+``&v=`` token that ``srcset`` adds to each URL is that same version, so
+those URLs can be cached forever.
+
+A per-source lock stops concurrent requests from encoding the same image
+twice in one process. Variants are written to a temporary file and moved
+into place with ``os.replace``, so ``serve`` workers racing on a cold
+cache still never see a partial file.
+"""
+
+from dataclasses import dataclass
+import hashlib
+import os
+import tempfile
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # optional; without it images are served as-is
+    Image = None
+
+WIDTHS = (320, 480, 768, 1024, 1600)
+SOURCE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+FORMATS = {"webp": "image/webp", "jpg": "image/jpeg"}
+QUALITY = {"webp": 78, "jpg": 80}
+
+
+@dataclass(frozen=True)
+class Source:
+    path: str
+    name: str      # path relative to the source directory, with "/" separators
+    version: str   # changes whenever the file does
+    width: int
+    height: int
+
+
+class ImageService:
+    def __init__(self, source_dir: str, cache_dir: str):
+        self.source_dir = os.path.realpath(source_dir)
+        self.cache_dir = cache_dir
+        self._sources = {}  # name -> (mtime_ns, size, Source)
+        self._locks = {}    # source path -> Lock
+        self._locks_guard = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def source(self, name: str):
+        """The raster image ``name`` under the source directory, or None."""
+        if Image is None:
+            return None
+        name = name.lstrip("/")
+        if not name.lower().endswith(SOURCE_EXTS):
+            return None
+        path = os.path.realpath(os.path.join(self.source_dir, name))
+        if not path.startswith(self.source_dir + os.sep):
+            return None
+        try:
+            st = os.stat(path)
+            cached = self._sources.get(name)
+            if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+                return cached[2]
+            with Image.open(path) as im:
+                width, height = im.size
+        except OSError:  # missing, or not an image Pillow can read
+            return None
+        version = hashlib.sha256(f"{name}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()[:12]
+        src = Source(path, name, version, width, height)
+        self._sources[name] = (st.st_mtime_ns, st.st_size, src)
+        return src
+
+    @staticmethod
+    def widths(src: Source):
+        """The buckets worth offering for ``src``: every one narrower than
+        it, plus its own width as the largest."""
+        return [w for w in WIDTHS if w < src.width] + [min(src.width, WIDTHS[-1])]
+
+    def bucket(self, src: Source, width: int) -> int:
+        for w in self.widths(src):
+            if w >= width:
+                return w
+        return self.widths(src)[-1]
+
+    def variant(self, src: Source, width: int, fmt: str) -> str:
+        """Path of ``src`` at bucket ``width`` in ``fmt``, encoding it on a miss."""
+        stem = os.path.splitext(src.name)[0].replace("/", "__")
+        path = os.path.join(self.cache_dir, f"{stem}-{src.version}-{width}.{fmt}")
+        if os.path.exists(path):
+            return path
+        with self._lock(src.path):
+            if not os.path.exists(path):  # another request may have just made it
+                self._encode(src, width, fmt, path)
+        return path
+
+    def _lock(self, key) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _encode(self, src: Source, width: int, fmt: str, path: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(src.path) as im:
+            im.draft("RGB", (width, width * src.height // src.width))  # cheap JPEG downscale
+            if width < im.width:
+                im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+            if fmt == "jpg":
+                if im.mode in ("RGBA", "LA", "P"):
+                    rgba = im.convert("RGBA")
+                    im = Image.new("RGB", rgba.size, (255, 255, 255))
+                    im.paste(rgba, mask=rgba.getchannel("A"))
+                elif im.mode != "RGB":
+                    im = im.convert("RGB")
+                options = {"format": "JPEG", "quality": QUALITY[fmt], "optimize": True, "progressive": True}
+            else:
+                options = {"format": "WEBP", "quality": QUALITY[fmt], "method": 4}
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    im.save(f, **options)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def url(self, src: Source, width: int, fmt: str) -> str:
+        return f"/img/{src.name}?w={width}&fm={fmt}&v={src.version}"
+
+    def srcset(self, src: Source, fmt: str) -> str:
+        return ", ".join(f"{self.url(src, w, fmt)} {w}w" for w in self.widths(src))
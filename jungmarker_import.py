@@ -0,0 +1,389 @@
+"""
+Bulk import of MLS / Zillow listing exports into listings.json.
+
+    python jungmarker_site.py import export.csv
+    python jungmarker_site.py import zillow.ndjson.gz --dry-run
+
+The export is streamed row by row through generators: ``read_rows`` (CSV or
+NDJSON, optionally gzipped) -> ``normalize`` (MLS and Zillow column names to
+the listings.json schema) -> ``Merge.apply``. Rows are never collected, so
+the export's size doesn't matter; what stays in memory is the listings
+file itself, which the site loads whole anyway.
+
+Rows are matched to existing records by a stable key: the MLS number when
+both sides have one, else street address plus ZIP. Only the fields an
+export row actually fills in are written over, so hand-curated extras
+(``imgUrl``, ``highlight``...) survive re-imports. Sold rows move a listing
+from ``active`` to ``sold``, and off-market statuses (withdrawn, expired,
+cancelled) drop an active listing.
+
+If anything changed, the file is rewritten to a temporary file in the same
+directory, fsynced, and moved over the old one with ``os.replace``. The
+site's ``ListingIndex`` sees either the old file or the new one, never half
+of one. If nothing changed, the file isn't touched.
+"""
+
+import csv
+from functools import lru_cache
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+
+from jungmarker_listings import zip_of
+
+log = logging.getLogger(__name__)
+
+# Export column -> listings.json field. Keys are matched after lowercasing
+# and dropping everything but letters and digits ("MLS #" -> "mls").
+COLUMN_ALIASES = {
+    "mlsId": ("mlsid", "mls", "mlsnumber", "listingid", "listingkey"),
+    "zpid": ("zpid",),
+    "status": ("status", "standardstatus", "mlsstatus", "homestatus", "listingstatus"),
+    "address": ("address", "streetaddress", "unparsedaddress", "fulladdress"),
+    "_city": ("city",),
+    "_state": ("state", "stateorprovince"),
+    "_zip": ("zip", "zipcode", "postalcode"),
+    "neighborhood": ("neighborhood", "subdivisionname", "subdivision"),
+    "county": ("county", "countyorparish"),
+    "_list_price": ("listprice", "price", "askingprice", "originallistprice"),
+    "_close_price": ("closeprice", "soldprice", "saleprice", "lastsoldprice"),
+    "daysOnMarket": ("daysonmarket", "dom", "cumulativedaysonmarket", "daysonzillow"),
+    "_close_date": ("closedate", "solddate", "datesold", "lastsolddate"),
+    "listDate": ("listdate", "listingcontractdate", "onmarketdate"),
+    "beds": ("beds", "bedrooms", "bedroomstotal"),
+    "baths": ("baths", "bathrooms", "bathroomstotalinteger", "bathroomstotaldecimal"),
+    "sqft": ("sqft", "squarefeet", "livingarea", "livingareasqft"),
+    "lat": ("lat", "latitude"),
+    "lng": ("lng", "lon", "longitude"),
+    "imgUrl": ("imgurl", "imgsrc", "photourl", "mediaurl"),
+    "zillowUrl": ("zillowurl", "detailurl", "hdpurl", "listingurl", "url"),
+}
+_ALIASES = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+_SOLD = {"sold", "closed", "recentlysold"}
+_ACTIVE = {
+    "active", "forsale", "comingsoon", "pending", "activeundercontract",
+    "undercontract", "contingent",
+}
+_OFF_MARKET = {"withdrawn", "expired", "canceled", "cancelled", "offmarket", "delete", "deleted"}
+
+_NOT_ALNUM = re.compile(r"[^a-z0-9]")
+_NUMBER_CHARS = re.compile(r"[$,\s]")
+INT_FIELDS = ("daysOnMarket", "sqft")
+FLOAT_FIELDS = ("beds", "baths", "lat", "lng")
+
+
+# ── Reading ──────────────────────────────────────────────────────────────────
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def read_rows(path: str):
+    """Yield each row of a CSV or NDJSON export as a dict, one at a time."""
+    stem = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as f:
+        if stem.endswith((".ndjson", ".jsonl")):
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{path}:{lineno}: {e}") from None
+        elif stem.endswith((".csv", ".tsv")):
+            yield from csv.DictReader(f, dialect="excel-tab" if stem.endswith(".tsv") else "excel")
+        else:
+            raise ValueError(f"{path}: expected .csv, .tsv, .ndjson or .jsonl (optionally .gz)")
+
+
+# ── Normalising ──────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=1024)
+def _field_for(column: str):
+    # Every row of an export repeats the same headers; normalise them once.
+    return _ALIASES.get(_NOT_ALNUM.sub("", column.lower()))
+
+
+def _columns(raw: dict):
+    """``(field, value)`` for every recognised, non-empty column, looking one
+    level into nested objects such as Zillow's ``address``."""
+    for column, value in raw.items():
+        if isinstance(value, dict):
+            yield from _columns(value)
+            continue
+        name = _field_for(str(column))
+        if name is not None and value not in (None, ""):
+            yield name, value
+
+
+def _number(value, kind=float):
+    if isinstance(value, bool):
+        return None
+    if not isinstance(value, (int, float)):
+        try:
+            value = float(_NUMBER_CHARS.sub("", str(value)))
+        except ValueError:
+            return None
+    return kind(value)
+
+
+def _date(value):
+    """An export date as a ``datetime``: ISO, US ``m/d/Y``, or epoch millis."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value / 1000 if value > 1e11 else value, timezone.utc)
+    value = str(value).strip()
+    for fmt, width in (("%Y-%m-%d", 10), ("%m/%d/%Y", None), ("%Y-%m", 7), ("%b %Y", None), ("%B %Y", None)):
+        try:
+            return datetime.strptime(value[:width] if width else value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def _status(value, has_close_price) -> str:
+    status = _NOT_ALNUM.sub("", str(value or "").lower())
+    if not status:
+        return "sold" if has_close_price else "active"
+    if status in _SOLD:
+        return "sold"
+    if status in _ACTIVE:
+        return "active"
+    if status in _OFF_MARKET:
+        return "off_market"
+    return ""
+
+
+def normalize_row(raw: dict):
+    """``(status, record)`` in listings.json form, or None if the row is
+    unusable. ``status`` is "active", "sold" or "off_market"."""
+    fields = {}
+    for name, value in _columns(raw):
+        fields.setdefault(name, value)
+    address = str(fields.pop("address", "")).strip()
+    status = _status(fields.pop("status", ""), "_close_price" in fields)
+    if not address or not status:
+        return None
+
+    record = {"address": address}
+    city = str(fields.pop("_city", "")).strip()
+    state = str(fields.pop("_state", "")).strip()
+    zip_code = str(fields.pop("_zip", "")).strip()[:5]
+    if city and not zip_of(city) and (state or zip_code):
+        city = f"{city}, {' '.join(filter(None, (state, zip_code)))}"
+    if city:
+        record["city"] = city
+    for name in ("mlsId", "zpid", "neighborhood", "county", "imgUrl", "zillowUrl"):
+        if name in fields:
+            record[name] = str(fields[name]).strip()
+    for name in INT_FIELDS + FLOAT_FIELDS:
+        if name in fields:
+            n = _number(fields[name], int if name in INT_FIELDS else float)
+            if n is not None:
+                record[name] = n
+
+    list_price = _number(fields.get("_list_price"), int)
+    close_price = _number(fields.get("_close_price"), int)
+    if status == "sold":
+        if not (close_price or list_price):
+            return None
+        if close_price:
+            record["salePrice"] = close_price
+            if list_price:
+                record["listPrice"] = list_price
+        else:
+            # Zillow's sold rows carry the sale price as plain "price".
+            record["salePrice"] = list_price
+        closed = _date(fields["_close_date"]) if "_close_date" in fields else None
+        if closed:
+            record["soldDate"] = closed.strftime("%b %Y")
+    elif status == "active":
+        if not list_price:
+            return None
+        record["price"] = list_price
+        listed = _date(fields["listDate"]) if "listDate" in fields else None
+        if listed:
+            record["listDate"] = listed.strftime("%Y-%m-%d")
+    return status, record
+
+
+def normalize(rows, result):
+    """``normalize_row`` over a stream of rows, counting them into ``result``."""
+    for raw in rows:
+        result.rows += 1
+        row = normalize_row(raw) if isinstance(raw, dict) else None
+        if row is None:
+            result.skipped += 1
+            continue
+        yield row
+
+
+# ── Diffing ──────────────────────────────────────────────────────────────────
+
+def _address_key(record: dict) -> str:
+    address = " ".join(_NOT_ALNUM.sub(" ", str(record.get("address", "")).lower()).split())
+    return f"addr:{address}|{zip_of(str(record.get('city', '')))}"
+
+
+def record_keys(record: dict):
+    """Stable keys of a record, most specific first."""
+    keys = []
+    if record.get("mlsId"):
+        keys.append(f"mls:{record['mlsId']}")
+    if record.get("zpid"):
+        keys.append(f"zpid:{record['zpid']}")
+    keys.append(_address_key(record))
+    return keys
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    written: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+class Merge:
+    """Applies normalised rows to a parsed listings.json document."""
+
+    def __init__(self, doc: dict, result: ImportResult):
+        self.doc = doc
+        self.result = result
+        # Removed records become None until ``document()`` drops them, so
+        # positions in ``_by_key`` stay valid.
+        self.lists = {status: list(doc.get(status) or ()) for status in ("active", "sold")}
+        self._by_key = {}  # stable key -> (status, position)
+        for status, records in self.lists.items():
+            for i, record in enumerate(records):
+                self._index(status, i, record)
+        ids = [r.get("id") for records in self.lists.values() for r in records]
+        self._next_id = max((i for i in ids if isinstance(i, int)), default=0) + 1
+
+    def _index(self, status, i, record):
+        for key in record_keys(record):
+            self._by_key[key] = (status, i)
+
+    def _find(self, record):
+        """``(status, position, matched key)`` of the existing record, or None."""
+        for key in record_keys(record):
+            found = self._by_key.get(key)
+            if found is not None:
+                return (*found, key)
+        return None
+
+    def _drop(self, status, i):
+        for key in record_keys(self.lists[status][i]):
+            if self._by_key.get(key) == (status, i):
+                del self._by_key[key]
+        self.lists[status][i] = None
+
+    def _append(self, status, record):
+        self.lists[status].append(record)
+        self._index(status, len(self.lists[status]) - 1, record)
+
+    def apply(self, status: str, record: dict):
+        found = self._find(record)
+        old_status, i, key = found if found else (None, None, "")
+        result = self.result
+        if status == "off_market":
+            if old_status == "active":
+                self._drop(old_status, i)
+                result.removed += 1
+            else:
+                result.unchanged += 1
+        elif (old_status, status) == ("sold", "active") and not key.startswith("addr:"):
+            # The same MLS listing can't be active after closing: a stale row.
+            result.unchanged += 1
+        elif found is None or (old_status, status) == ("sold", "active"):
+            # New, or back on the market after a sale: the sale stays a comp.
+            self._append(status, {"id": self._next_id, **record})
+            self._next_id += 1
+            result.added += 1
+        else:
+            old = self.lists[old_status][i]
+            merged = {**old, **record}
+            if old_status != status:  # active -> sold
+                merged.pop("price", None)
+                self._drop(old_status, i)
+                self._append(status, merged)
+                result.updated += 1
+            elif merged != old:
+                self.lists[status][i] = merged
+                self._index(status, i, merged)
+                result.updated += 1
+            else:
+                result.unchanged += 1
+
+    def document(self) -> dict:
+        doc = dict(self.doc)
+        for status, records in self.lists.items():
+            doc[status] = [r for r in records if r is not None]
+        return doc
+
+
+# ── Writing ──────────────────────────────────────────────────────────────────
+
+def write_atomic(path: str, doc: dict):
+    """Replace ``path`` with ``doc`` so readers see the old or new file whole."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".listings-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)  # mkstemp makes it 0600; the site serves this file
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def import_listings(source: str, dest: str, dry_run: bool = False) -> ImportResult:
+    """Merge the export at ``source`` into the listings file ``dest``.
+
+    Holds an exclusive lock on ``dest``'s directory from read to write, so
+    two imports can't lose each other's changes. (Locking the file itself
+    wouldn't do: ``os.replace`` swaps it for a new one.)
+    """
+    result = ImportResult()
+    dir_fd = os.open(os.path.dirname(os.path.abspath(dest)), os.O_RDONLY)
+    try:
+        fcntl.flock(dir_fd, fcntl.LOCK_EX)
+        with open(dest, "rb") as f:
+            doc = json.load(f)
+        merge = Merge(doc, result)
+        for status, record in normalize(read_rows(source), result):
+            merge.apply(status, record)
+        if result.changed and not dry_run:
+            write_atomic(dest, merge.document())
+            result.written = True
+    finally:
+        os.close(dir_fd)
+    log.info("listings import", extra={"source": source, "dest": dest, **vars(result)})
+    return result
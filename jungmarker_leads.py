@@ -0,0 +1,553 @@
+"""
+Durable lead storage for the jungmarker.com contact form.
+
+Submissions go into an in-memory queue on the request thread and a single
+background writer drains it into SQLite (WAL mode) in batches, so one commit
+and one fsync cover every lead that arrived during a flush interval.
+
+Each submission is also resolved to a person (see jungmarker_identity), so
+repeat inquiries from one prospect share a ``person_id``.
+
+Reads go through ``query_leads``, which filters on indexed columns and pages
+with a keyset cursor over (created_at, id) rather than OFFSET. Bulk exports
+(``export_leads``) walk the same indexes page by page and stream CSV or
+NDJSON, so their memory use does not grow with the date range.
+"""
+
+import atexit
+import base64
+import csv
+from datetime import datetime, timezone
+import io
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from jungmarker_identity import backfill, email_key, phone_key, resolve
+
+log = logging.getLogger(__name__)
+
+LEAD_FIELDS = ("first_name", "last_name", "email", "phone", "zip", "interest", "message")
+MAX_FIELD_LENGTH = 5000
+_LINE_BREAK_RE = re.compile(r"[\r\n\v\f\x1c-\x1e\x85\u2028\u2029]+")
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    """
+    CREATE TABLE leads (
+        id          INTEGER PRIMARY KEY,
+        created_at  TEXT NOT NULL,
+        first_name  TEXT NOT NULL DEFAULT '',
+        last_name   TEXT NOT NULL DEFAULT '',
+        email       TEXT NOT NULL DEFAULT '',
+        phone       TEXT NOT NULL DEFAULT '',
+        interest    TEXT NOT NULL DEFAULT '',
+        message     TEXT NOT NULL DEFAULT ''
+    )
+    """,
+    """
+    ALTER TABLE leads ADD COLUMN interest_code TEXT NOT NULL DEFAULT 'other';
+    ALTER TABLE leads ADD COLUMN email_key TEXT NOT NULL DEFAULT '';
+    ALTER TABLE leads ADD COLUMN phone_key TEXT NOT NULL DEFAULT '';
+    UPDATE leads SET interest_code = interest_code(interest),
+                     email_key = email_key(email),
+                     phone_key = phone_key(phone);
+    CREATE INDEX leads_created ON leads (created_at, id);
+    CREATE INDEX leads_interest ON leads (interest_code, created_at, id);
+    CREATE INDEX leads_email ON leads (email_key, created_at, id);
+    CREATE INDEX leads_phone ON leads (phone_key, created_at, id);
+    """,
+    """
+    ALTER TABLE leads ADD COLUMN agent TEXT NOT NULL DEFAULT '';
+    CREATE INDEX leads_agent ON leads (agent, created_at, id);
+    """,
+    """
+    ALTER TABLE leads ADD COLUMN zip TEXT NOT NULL DEFAULT '';
+    ALTER TABLE leads ADD COLUMN person_id INTEGER;
+    UPDATE leads SET email_key = email_key(email), phone_key = phone_key(phone);
+    CREATE INDEX leads_person ON leads (person_id, created_at, id);
+    CREATE TABLE people (
+        id          INTEGER PRIMARY KEY,
+        first_seen  TEXT NOT NULL,
+        last_seen   TEXT NOT NULL,
+        submissions INTEGER NOT NULL DEFAULT 0,
+        first_name  TEXT NOT NULL DEFAULT '',
+        last_name   TEXT NOT NULL DEFAULT '',
+        email       TEXT NOT NULL DEFAULT '',
+        phone       TEXT NOT NULL DEFAULT '',
+        zip         TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE person_keys (
+        key         TEXT NOT NULL,
+        person_id   INTEGER NOT NULL,
+        PRIMARY KEY (key, person_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX person_keys_person ON person_keys (person_id);
+    """,
+]
+
+INTEREST_CODES = ("buy", "sell", "invest", "cma", "other")
+
+# Form option labels (this site) and intent codes (the React site's form).
+_INTEREST_LABELS = {
+    "buying a home": "buy",
+    "selling my home": "sell",
+    "investment properties": "invest",
+    "free home valuation": "cma",
+}
+
+_STOP = object()
+
+
+def interest_code(interest: str) -> str:
+    value = interest.strip().lower()
+    if value in INTEREST_CODES:
+        return value
+    return _INTEREST_LABELS.get(value, "other")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the lead database, creating or migrating the schema as needed."""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for fn in (interest_code, email_key, phone_key):
+        conn.create_function(fn.__name__, 1, fn, deterministic=True)
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn):
+    """Apply the pending MIGRATIONS, each in its own write transaction.
+
+    ``serve`` workers all open the database at once, so the version is
+    re-read after taking the write lock: whichever process gets there first
+    applies a step, and the others find it done.
+    """
+    while conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < len(MIGRATIONS):
+                for statement in MIGRATIONS[version].split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def clean_lead(data: dict) -> dict:
+    """Keep only the form fields, as bounded strings. Only ``message`` may
+    span lines; line breaks elsewhere (which would otherwise end up in
+    notification email headers) become spaces."""
+    lead = {}
+    for field in LEAD_FIELDS:
+        value = str(data.get(field) or "")
+        if field != "message":
+            value = " ".join(_LINE_BREAK_RE.split(value))
+        lead[field] = value.strip()[:MAX_FIELD_LENGTH]
+    return lead
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def parse_time(value: str) -> str:
+    """Normalise an ISO date or datetime to the stored ``created_at`` form.
+
+    Naive values are taken as UTC. Raises ValueError on bad input.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return _iso(dt.timestamp())
+
+
+def encode_cursor(created_at: str, lead_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{lead_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of ``encode_cursor``. Raises ValueError on a malformed cursor."""
+    try:
+        created_at, lead_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return created_at, int(lead_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+LEAD_COLUMNS = ("id", "created_at", *LEAD_FIELDS, "interest_code", "agent", "person_id")
+PERSON_COLUMNS = (
+    "id", "first_seen", "last_seen", "submissions",
+    "first_name", "last_name", "email", "phone", "zip",
+)
+MAX_PAGE_SIZE = 500
+
+
+def _filters(since=None, until=None, interest=None, agent=None,
+             person=None, email=None, phone=None):
+    where, args = [], []
+    if interest:
+        where.append("interest_code = ?")
+        args.append(interest_code(interest))
+    if agent:
+        where.append("agent = ?")
+        args.append(agent)
+    if person:
+        where.append("person_id = ?")
+        args.append(int(person))
+    if email:
+        where.append("email_key = ?")
+        args.append(email_key(email))
+    if phone:
+        where.append("phone_key = ?")
+        args.append(phone_key(phone))
+    if since:
+        where.append("created_at >= ?")
+        args.append(since)
+    if until:
+        where.append("created_at < ?")
+        args.append(until)
+    return where, args
+
+
+def query_leads(conn, since=None, until=None, interest=None, agent=None,
+                person=None, email=None, phone=None, cursor=None, limit=50):
+    """Return ``(leads, next_cursor)``, newest first.
+
+    ``since`` is inclusive and ``until`` exclusive (both stored-form
+    timestamps, see ``parse_time``). Every filter combination is served by
+    one of the (key, created_at, id) indexes, and each page resumes strictly
+    after the previous page's last row, so deep pages cost the same as the
+    first one.
+    """
+    where, args = _filters(since, until, interest, agent, person, email, phone)
+    if cursor:
+        where.append("(created_at, id) < (?, ?)")
+        args.extend(decode_cursor(cursor))
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    sql = (
+        f"SELECT {', '.join(LEAD_COLUMNS)} FROM leads"
+        + (f" WHERE {' AND '.join(where)}" if where else "")
+        + " ORDER BY created_at DESC, id DESC LIMIT ?"
+    )
+    rows = [dict(r) for r in conn.execute(sql, (*args, limit + 1))]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+def get_person(conn, person_id: int, limit=MAX_PAGE_SIZE):
+    """A person and their most recent submissions, or None."""
+    row = conn.execute(
+        f"SELECT {', '.join(PERSON_COLUMNS)} FROM people WHERE id = ?", (person_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    history, _ = query_leads(conn, person=person_id, limit=limit)
+    return {**dict(row), "history": history}
+
+
+# ── Bulk export ──────────────────────────────────────────────────────────────
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_PAGE_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Spreadsheets run cells starting with these as formulas; phone numbers
+# like "+1 (301) 555-0100" are left alone.
+_FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+_NUMBER_RE = re.compile(r"[+-]?\d[\d\s().]*")
+
+
+def iter_leads(conn, since=None, until=None, interest=None, agent=None, person=None,
+               page_size=EXPORT_PAGE_SIZE):
+    """Yield every matching lead, oldest first, a keyset page at a time.
+
+    Each page is its own short read, so an export of any size holds one page
+    in memory and never pins a WAL snapshot (which would stop checkpoints
+    while the writer keeps committing).
+    """
+    where, args = _filters(since, until, interest, agent, person)
+    sql = (
+        f"SELECT {', '.join(LEAD_COLUMNS)} FROM leads WHERE "
+        + " AND ".join([*where, "(created_at, id) > (?, ?)"])
+        + " ORDER BY created_at, id LIMIT ?"
+    )
+    after = ("", 0)
+    while True:
+        rows = conn.execute(sql, (*args, *after, page_size)).fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_START) and not _NUMBER_RE.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def export_leads(path: str, fmt: str = "csv", compress: bool = False, **filters):
+    """Stream matching leads from the database at ``path`` as CSV or NDJSON
+    bytes, optionally gzipped, in chunks of about ``EXPORT_CHUNK_BYTES``.
+
+    Opens its own connection, closed when the generator finishes or is
+    closed early (a client disconnecting mid-download).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip framing
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf, lineterminator="\r\n")
+        writer.writerow(LEAD_COLUMNS)
+
+    def take():
+        data = buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+        return gz.compress(data) if gz else data
+
+    conn = connect(path)
+    try:
+        for row in iter_leads(conn, **filters):
+            if fmt == "csv":
+                writer.writerow([_csv_cell(v) for v in row])
+            else:
+                buf.write(json.dumps(dict(row), ensure_ascii=False))
+                buf.write("\n")
+            if buf.tell() >= EXPORT_CHUNK_BYTES:
+                chunk = take()
+                if chunk:
+                    yield chunk
+        tail = take() + (gz.flush() if gz else b"")
+        if tail:
+            yield tail
+    finally:
+        conn.close()
+
+
+class LeadStore:
+    """Append-only lead log with a batching background writer.
+
+    ``submit`` is O(1) and never touches the disk. The writer thread commits
+    whatever is queued at most ``flush_interval`` seconds after the first
+    lead of a batch arrives, or as soon as ``batch_size`` leads are waiting.
+    A failed commit is retried with backoff, reconnecting each time; a batch
+    still failing after ``max_attempts`` is written lead by lead, and any
+    lead that fails on its own goes to the JSON-lines dead-letter file, so
+    nothing is dropped silently. ``close`` (registered with atexit) drains
+    the queue.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.2, batch_size: int = 500,
+                 max_attempts: int = 8, dead_letter_path: str = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path or os.path.splitext(path)[0] + "-dead-letter.jsonl"
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._conn = None  # the writer thread's connection
+        self._readers = threading.local()
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "LeadStore":
+        return cls(
+            os.environ.get("LEADS_DB", default_path),
+            flush_interval=float(os.environ.get("LEADS_FLUSH_INTERVAL", 0.2)),
+            batch_size=int(os.environ.get("LEADS_BATCH_SIZE", 500)),
+            dead_letter_path=os.environ.get("LEADS_DEAD_LETTER"),
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def reader(self) -> sqlite3.Connection:
+        """A per-thread read connection; WAL lets reads run beside the writer."""
+        conn = getattr(self._readers, "conn", None)
+        if conn is None or self._readers.pid != os.getpid():
+            conn = connect(self.path)
+            self._readers.conn, self._readers.pid = conn, os.getpid()
+        return conn
+
+    def submit(self, lead: dict):
+        self._ensure_writer()
+        self._queue.put((time.time(), lead))
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the writer."""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_writer(self):
+        # Started lazily and per process, so forked workers get their own,
+        # and restarted should the thread ever die.
+        thread = self._thread
+        if self._pid == os.getpid() and thread is not None and thread.is_alive():
+            return
+        with self._lock:
+            thread = self._thread
+            if self._pid == os.getpid() and thread is not None and thread.is_alive():
+                return
+            if self._pid == os.getpid():
+                log.error("lead writer thread died; restarting it")
+            else:
+                self._conn = None  # the parent's, if any
+                atexit.register(self.close)
+            self._thread = threading.Thread(target=self._run, name="lead-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+        return self._conn
+
+    def _disconnect(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _run(self):
+        try:
+            try:
+                resolved = backfill(self._connection())
+                if resolved:
+                    log.info("resolved identities of %d earlier leads", resolved)
+            except Exception:
+                # New leads still get resolved; the next start tries again.
+                log.exception("identity backfill failed")
+                self._disconnect()
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is _STOP
+                if stop:
+                    batch.pop()
+                    # Drain whatever raced in ahead of the sentinel.
+                    while True:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                if batch:
+                    try:
+                        self._commit(batch)
+                    except Exception:
+                        # Only the dead-letter write itself can get here.
+                        log.exception("lost a batch of %d leads", len(batch))
+                if stop:
+                    return
+        finally:
+            self._disconnect()
+
+    def _commit(self, batch):
+        """Write ``batch``, retrying; dead-letter whatever can't be written."""
+        delay = 0.05
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._write(self._connection(), batch)
+                return
+            except Exception as e:
+                log.exception("lead batch of %d failed to commit (attempt %d of %d)",
+                              len(batch), attempt, self.max_attempts)
+                self._disconnect()
+                error = e
+                if attempt < self.max_attempts:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+        # One bad lead shouldn't take its whole batch down with it.
+        failed = [(item, error) for item in batch]
+        if len(batch) > 1:
+            failed = []
+            for item in batch:
+                try:
+                    self._write(self._connection(), [item])
+                except Exception as e:
+                    self._disconnect()
+                    failed.append((item, e))
+        if failed:
+            self._dead_letter(failed)
+
+    def _dead_letter(self, failed):
+        failed_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        lines = "".join(
+            json.dumps({
+                "failed_at": failed_at,
+                "error": repr(error),
+                "lead": {"created_at": _iso(ts), **lead},
+            }, ensure_ascii=False, default=str) + "\n"
+            for (ts, lead), error in failed
+        )
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        log.error("wrote %d leads to %s", len(failed), self.dead_letter_path)
+
+    def _write(self, conn, batch):
+        columns = (
+            "created_at", *LEAD_FIELDS, "interest_code", "email_key", "phone_key",
+            "agent", "person_id",
+        )
+        sql = (
+            f"INSERT INTO leads ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        # IMMEDIATE takes the write lock before identity lookups, so two
+        # workers can't both file the same new person.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ts, lead in batch:
+                created_at = _iso(ts)
+                conn.execute(sql, (
+                    created_at,
+                    *(lead[f] for f in LEAD_FIELDS),
+                    interest_code(lead["interest"]),
+                    email_key(lead["email"]),
+                    phone_key(lead["phone"]),
+                    lead.get("agent", ""),
+                    resolve(conn, lead, created_at),
+                ))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
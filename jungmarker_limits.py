@@ -0,0 +1,143 @@
+"""
+Rate limits and abuse controls.
+
+``TokenBucketLimiter`` and ``DedupFilter`` are in-process and bounded
+``OrderedDict``s: every check is O(1) and the least recently seen key is
+evicted once ``max_keys`` is reached, so memory stays capped however many
+distinct clients show up.
+
+``SharedRateLimiter`` spaces out calls to an outside API across every
+process on the host (all ``serve`` workers), through a small locked file.
+"""
+
+from collections import OrderedDict
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """Per-key token bucket: ``burst`` requests at once, refilled at ``rate``/s.
+
+    An evicted key simply starts again with a full bucket, which only ever
+    errs on the side of letting a request through.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be greater than 0 and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def acquire(self, key) -> float:
+        """Take a token for ``key``; return 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.pop(key, None)
+            if state is None:
+                tokens = float(self.burst)
+            else:
+                tokens, last = state
+                tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def wait(self, key):
+        """Block until a token for ``key`` has been taken.
+
+        A refused ``acquire`` takes nothing, so this asks again after each
+        sleep rather than assuming the token is waiting.
+        """
+        while delay := self.acquire(key):
+            time.sleep(delay)
+
+
+class SharedRateLimiter:
+    """At most ``rate`` calls per second across every process using ``path``.
+
+    The file holds the next free time slot. ``acquire`` reserves it under
+    ``flock`` and moves it on by ``1 / rate``, so callers in any process are
+    handed slots one interval apart and sleep until theirs comes up.
+    """
+
+    # A slot further ahead than this means the wall clock stepped back.
+    MAX_AHEAD = 60.0
+
+    def __init__(self, path: str, rate: float):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.path = path
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+
+    def acquire(self, key=None) -> float:
+        """Reserve the next slot; return seconds to wait until it (0 for now)."""
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                now = time.time()
+                try:
+                    slot = float(os.pread(fd, 64, 0) or 0)
+                except ValueError:
+                    slot = 0.0
+                if not now <= slot <= now + self.MAX_AHEAD:
+                    slot = now
+                os.pwrite(fd, f"{slot + self.interval:<32.6f}".encode(), 0)
+            finally:
+                os.close(fd)
+        return slot - now
+
+    def wait(self, key=None):
+        """Block until a reserved slot comes up. Every ``acquire`` reserves a
+        slot, so this sleeps once rather than asking again."""
+        delay = self.acquire(key)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DedupFilter:
+    """Remembers fingerprints for ``window`` seconds to drop repeats.
+
+    Entries are kept in arrival order, so expired ones are always at the
+    front and are purged as new ones arrive.
+    """
+
+    def __init__(self, window: float, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._seen = OrderedDict()  # fingerprint -> first seen time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(*parts: str) -> bytes:
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).digest()
+
+    def is_duplicate(self, fingerprint: bytes) -> bool:
+        """True if seen within the window; otherwise record it and return False."""
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen
+            while seen:
+                oldest, ts = next(iter(seen.items()))
+                if now - ts < self.window:
+                    break
+                del seen[oldest]
+            if fingerprint in seen:
+                return True
+            seen[fingerprint] = now
+            if len(seen) > self.max_keys:
+                seen.popitem(last=False)
+        return False
@@ -0,0 +1,366 @@
+"""
+Listing data for jungmarker.com, loaded from public/listings.json.
+
+The file is parsed into compact, typed ``Listing`` records once per version.
+``ListingIndex.snapshot()`` re-stats the file at most once per
+``check_interval`` and swaps in a freshly built snapshot only when its mtime
+or size changed, so readers never see a half-loaded index.
+"""
+
+import bisect
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+STATUSES = ("active", "sold")
+SORT_KEYS = ("price", "-price", "date", "-date")
+_ZIP_RE = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+
+
+@dataclass(frozen=True, slots=True)
+class Listing:
+    id: int
+    status: str          # "active" or "sold"
+    address: str
+    city: str
+    neighborhood: str
+    county: str
+    price: int           # asking price if active, sale price if sold
+    list_price: int
+    days_on_market: int
+    date: str            # ISO "YYYY-MM" or "YYYY-MM-DD"; "" if unknown
+    sold_date: str       # as written in the file, e.g. "Jan 2026"
+    beds: float
+    baths: float
+    sqft: int
+    lat: float           # optional geocode; 0.0 if the file doesn't give one
+    lng: float
+    img_url: str
+    url: str
+    highlight: str
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "address": self.address,
+            "city": self.city,
+            "neighborhood": self.neighborhood,
+            "county": self.county,
+            "price": self.price,
+            "listPrice": self.list_price,
+            "daysOnMarket": self.days_on_market,
+            "soldDate": self.sold_date or None,
+            "beds": self.beds or None,
+            "baths": self.baths or None,
+            "sqft": self.sqft or None,
+            "lat": self.lat or None,
+            "lng": self.lng or None,
+            "imgUrl": self.img_url or None,
+            "url": self.url or None,
+            "highlight": self.highlight or None,
+        }
+
+
+def zip_of(text: str) -> str:
+    """The first five-digit ZIP code in ``text``, or ``""``."""
+    m = _ZIP_RE.search(text or "")
+    return m.group(1) if m else ""
+
+
+def parse_date(value: str) -> str:
+    """``"Jan 2026"`` -> ``"2026-01"``; ISO dates pass through; else ``""``."""
+    value = (value or "").strip()
+    for fmt, out in (("%b %Y", "%Y-%m"), ("%B %Y", "%Y-%m"), ("%Y-%m-%d", "%Y-%m-%d"), ("%Y-%m", "%Y-%m")):
+        try:
+            return datetime.strptime(value, fmt).strftime(out)
+        except ValueError:
+            pass
+    return ""
+
+
+def _num(value, kind=int):
+    try:
+        return kind(value or 0)
+    except (TypeError, ValueError):
+        return kind(0)
+
+
+def make_listing(raw: dict, status: str) -> Listing:
+    sold = status == "sold"
+    price = raw.get("salePrice") if sold else raw.get("price")
+    list_price = raw.get("listPrice", price)
+    sold_date = str(raw.get("soldDate") or "")
+    return Listing(
+        id=_num(raw.get("id")),
+        status=status,
+        address=str(raw.get("address") or ""),
+        city=str(raw.get("city") or ""),
+        neighborhood=str(raw.get("neighborhood") or ""),
+        county=str(raw.get("county") or ""),
+        price=_num(price),
+        list_price=_num(list_price),
+        days_on_market=_num(raw.get("daysOnMarket")),
+        date=parse_date(sold_date if sold else str(raw.get("listDate") or "")),
+        sold_date=sold_date,
+        beds=_num(raw.get("beds"), float),
+        baths=_num(raw.get("baths"), float),
+        sqft=_num(raw.get("sqft")),
+        lat=_num(raw.get("lat"), float),
+        lng=_num(raw.get("lng", raw.get("lon")), float),
+        img_url=str(raw.get("imgUrl") or ""),
+        url=str(raw.get("zillowUrl") or raw.get("url") or ""),
+        highlight=str(raw.get("highlight") or ""),
+    )
+
+
+class ListingSnapshot:
+    """One immutable version of the listings file plus its sorted views."""
+
+    def __init__(self, data: bytes, mtime_ns: int, size: int):
+        raw = json.loads(data)
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        self.listings = tuple(
+            make_listing(item, status)
+            for status in STATUSES
+            for item in raw.get(status) or ()
+        )
+        self.by_price = tuple(sorted(self.listings, key=lambda l: (l.price, l.id)))
+        self.by_date = tuple(sorted(self.listings, key=lambda l: (l.date, l.id)))
+        self._responses = OrderedDict()
+        self._responses_lock = threading.Lock()
+
+    def query(self, status=None, county=None, neighborhood=None,
+              min_price=None, max_price=None, sort="-date", limit=None):
+        """Filter and sort without copying or re-parsing anything.
+
+        ``county`` and ``neighborhood`` match case-insensitively; prices are
+        inclusive bounds.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        view = self.by_price if sort.lstrip("-") == "price" else self.by_date
+        if sort.startswith("-"):
+            view = reversed(view)
+        county = county.lower() if county else None
+        neighborhood = neighborhood.lower() if neighborhood else None
+        out = []
+        for l in view:
+            if status and l.status != status:
+                continue
+            if county and l.county.lower() != county:
+                continue
+            if neighborhood and l.neighborhood.lower() != neighborhood:
+                continue
+            if min_price is not None and l.price < min_price:
+                continue
+            if max_price is not None and l.price > max_price:
+                continue
+            out.append(l)
+            if limit and len(out) >= limit:
+                break
+        return out
+
+    def cached_response(self, key, build, max_entries=256):
+        """Memoise a serialised response for this snapshot, LRU-bounded."""
+        with self._responses_lock:
+            body = self._responses.get(key)
+            if body is not None:
+                self._responses.move_to_end(key)
+                return body
+        body = build()
+        with self._responses_lock:
+            self._responses[key] = body
+            if len(self._responses) > max_entries:
+                self._responses.popitem(last=False)
+        return body
+
+
+class ListingIndex:
+    """Hot-reloading holder for the current ``ListingSnapshot``."""
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> ListingSnapshot:
+        snap = self._snapshot
+        if snap is not None and time.monotonic() - self._checked < self.check_interval:
+            return snap
+        with self._lock:
+            self._checked = time.monotonic()
+            snap = self._snapshot
+            try:
+                st = os.stat(self.path)
+                if snap is None or (st.st_mtime_ns, st.st_size) != (snap.mtime_ns, snap.size):
+                    with open(self.path, "rb") as f:
+                        data = f.read()
+                    snap = ListingSnapshot(data, st.st_mtime_ns, st.st_size)
+                    self._snapshot = snap
+            except (OSError, ValueError):
+                # A hand edit in progress; keep serving the last good version
+                # and try again on the next check.
+                if snap is None:
+                    raise
+                log.exception("could not reload %s; keeping previous listings", self.path)
+        return snap
+
+
+# ── Typeahead ────────────────────────────────────────────────────────────────
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+MAX_PREFIX = 12
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SuggestIndex:
+    """Prefix and trigram inverted index over listing locations.
+
+    Every token of ``address``, ``city`` (which carries the ZIP),
+    ``neighborhood`` and ``county`` is indexed under each of its prefixes,
+    and the whole searchable text under its trigrams for mid-word matches.
+    Prices are kept in a sorted array so a price range is two bisects.
+
+    ``sync`` diffs a new snapshot against the indexed one and only touches
+    postings of listings that were added, removed or changed.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._docs = {}          # (status, id, n) -> (Listing, searchable text, rank)
+        self._prefixes = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        self._prices = []        # sorted (price, key)
+        self._ranked = []        # sorted (rank, key)
+        self._lock = threading.Lock()
+
+    def sync(self, snap: ListingSnapshot):
+        if self.version == snap.etag:
+            return
+        with self._lock:
+            if self.version == snap.etag:
+                return
+            # n tells apart listings sharing a status and id (a missing id
+            # is 0), so none of them silently replaces another.
+            current, seen = {}, Counter()
+            for l in snap.listings:
+                n = seen[l.status, l.id]
+                seen[l.status, l.id] += 1
+                current[l.status, l.id, n] = l
+            for key, (listing, _, _) in list(self._docs.items()):
+                if current.get(key) != listing:
+                    self._remove(key)
+            for key, listing in current.items():
+                if key not in self._docs:
+                    self._add(key, listing)
+            self.version = snap.etag
+
+    def _add(self, key, listing):
+        text = " ".join(tokenize(" ".join(
+            (listing.address, listing.city, listing.neighborhood, listing.county)
+        )))
+        # Active before sold, then most expensive first.
+        rank = (listing.status != "active", -listing.price, listing.id)
+        self._docs[key] = (listing, text, rank)
+        bisect.insort(self._ranked, (rank, key))
+        for token in set(text.split()):
+            for n in range(1, min(len(token), MAX_PREFIX) + 1):
+                self._prefixes[token[:n]].add(key)
+        for gram in _trigrams(text):
+            self._trigrams[gram].add(key)
+        bisect.insort(self._prices, (listing.price, key))
+
+    def _remove(self, key):
+        listing, text, rank = self._docs.pop(key)
+        del self._ranked[bisect.bisect_left(self._ranked, (rank, key))]
+        for token in set(text.split()):
+            for n in range(1, min(len(token), MAX_PREFIX) + 1):
+                _discard(self._prefixes, token[:n], key)
+        for gram in _trigrams(text):
+            _discard(self._trigrams, gram, key)
+        i = bisect.bisect_left(self._prices, (listing.price, key))
+        del self._prices[i]
+
+    def _term(self, term):
+        if len(term) <= MAX_PREFIX:
+            keys = self._prefixes.get(term)
+            if keys:
+                return keys
+        else:
+            keys = {k for k in self._prefixes.get(term[:MAX_PREFIX], ())
+                    if f" {term}" in f" {self._docs[k][1]}"}
+            if keys:
+                return keys
+        if len(term) < 3:
+            return set()
+        # Mid-word match ("aylis" -> "Baylis"): intersect trigram postings,
+        # smallest first, then confirm against the text.
+        postings = sorted((self._trigrams.get(g, set()) for g in _trigrams(term)), key=len)
+        keys = set(postings[0]).intersection(*postings[1:])
+        return {k for k in keys if term in self._docs[k][1]}
+
+    def search(self, query: str, min_price=None, max_price=None, limit=10):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            docs = self._docs
+            # Longest (most selective) term first; postings are never mutated.
+            keys = None
+            for term in sorted(terms, key=len, reverse=True):
+                found = self._term(term)
+                keys = found if keys is None else keys & found
+                if not keys:
+                    return []
+            if min_price is not None or max_price is not None:
+                lo = bisect.bisect_left(self._prices, (min_price or 0,))
+                hi = (bisect.bisect_right(self._prices, (max_price, (chr(0x10FFFF),)))
+                      if max_price is not None else len(self._prices))
+                if hi - lo < len(keys):
+                    keys = keys & {key for _, key in self._prices[lo:hi]}
+                else:
+                    keys = {k for k in keys
+                            if (min_price is None or docs[k][0].price >= min_price)
+                            and (max_price is None or docs[k][0].price <= max_price)}
+            if len(keys) > 50 * limit:
+                # Broad query ("b"): walking the global ranking finds the top
+                # matches after ~limit/selectivity steps.
+                best = []
+                for _, key in self._ranked:
+                    if key in keys:
+                        best.append(key)
+                        if len(best) == limit:
+                            break
+            else:
+                best = heapq.nsmallest(limit, keys, key=lambda k: docs[k][2])
+            return [docs[k][0] for k in best]
+
+
+def _discard(index, term, key):
+    keys = index.get(term)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[term]
@@ -0,0 +1,278 @@
+"""
+Structured JSON-lines logging that never blocks a request.
+
+``configure_logging`` puts a queue handler on the root logger, so a log
+call on a request thread only appends the record to an in-memory queue.
+A listener thread formats each record as one JSON object per line, masks
+personal data, and writes to a size-rotated file in batches. The buffer is
+flushed whenever the queue runs dry.
+
+Several ``serve`` workers may share one file. Each flush is a single
+``O_APPEND`` write of whole lines, and rotation happens under a lock
+file. A worker whose file was rotated away by another reopens it on its
+next flush.
+
+Environment:
+  LOG_FILE       path of the JSON-lines log, or "-" for stderr
+                 (default logs/jungmarker.jsonl)
+  LOG_LEVEL      root level (default INFO)
+  LOG_MAX_BYTES  rotate past this size (default 10 MB)
+  LOG_BACKUPS    rotated files kept (default 5)
+  LOG_PII        how to record names, email, phone and message:
+                 "mask" (default), "hash", "drop" or "plain"
+  LOG_PII_SALT   key for "hash", so the same email hashes the same way
+"""
+
+import atexit
+from datetime import datetime, timezone
+import fcntl
+import hashlib
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import sys
+import threading
+
+PII_FIELDS = ("first_name", "last_name", "email", "phone", "message")
+PII_MODES = ("mask", "hash", "drop", "plain")
+FLUSH_BYTES = 64 * 1024
+
+# LogRecord attributes that are not user-supplied ``extra`` fields.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+# ── PII masking ──────────────────────────────────────────────────────────────
+
+def _mask_email(value: str) -> str:
+    local, at, domain = value.partition("@")
+    return f"{local[:1]}***{at}{domain}" if at else "***"
+
+
+def _mask_phone(value: str) -> str:
+    digits = "".join(c for c in value if c.isdigit())
+    return f"***{digits[-4:]}" if len(digits) >= 4 else "***"
+
+
+def _mask(field: str, value: str) -> str:
+    if not value:
+        return value
+    if field == "email":
+        return _mask_email(value)
+    if field == "phone":
+        return _mask_phone(value)
+    if field == "message":
+        return f"[{len(value)} chars]"
+    return f"{value[:1]}."
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, pid, the
+    ``extra`` fields, and ``exc`` when there is a traceback."""
+
+    def __init__(self, pii="mask", salt=""):
+        super().__init__()
+        if pii not in PII_MODES:
+            raise ValueError(f"LOG_PII must be one of {', '.join(PII_MODES)}")
+        self.pii = pii
+        self.salt = salt.encode()
+
+    def _scrub(self, field, value):
+        if self.pii == "mask":
+            return _mask(field, str(value))
+        return hashlib.blake2b(str(value).encode(), key=self.salt[:64], digest_size=8).hexdigest()
+
+    def _fields(self, items):
+        """``extra`` fields with PII handled, one level into dicts such as
+        ``extra={"lead": lead}``."""
+        out = {}
+        for key, value in items:
+            if key in PII_FIELDS and self.pii != "plain":
+                if self.pii == "drop":
+                    continue
+                value = self._scrub(key, value)
+            elif isinstance(value, dict):
+                value = self._fields(value.items())
+            out[key] = value
+        return out
+
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        extra = ((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS and k not in out)
+        out.update(self._fields(extra))
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+# ── Output ───────────────────────────────────────────────────────────────────
+
+class RotatingJsonLinesHandler(logging.Handler):
+    """Buffers formatted lines and appends them with one write per flush.
+
+    Only the listener thread calls ``emit``/``flush``. Rotation renames
+    ``path`` to ``path.1`` (shifting older backups up) under an exclusive
+    lock on ``path.lock``, so concurrent processes rotate it once.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._buffer = []
+        self._buffered = 0
+        self._fd = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        data = "".join(self._buffer).encode("utf-8")
+        self._buffer.clear()
+        self._buffered = 0
+        try:
+            fd = self._open()
+            while data:
+                data = data[os.write(fd, data):]
+            if self.max_bytes and os.fstat(fd).st_size >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            # Same policy as logging.Handler.handleError: report, don't raise.
+            if logging.raiseExceptions:
+                sys.stderr.write(f"--- logging error writing {self.path}: {e}\n")
+
+    def _open(self):
+        # Reopen when another process rotated the file away from us.
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return self._fd
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        return self._fd
+
+    def _rotate(self):
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if st.st_size < self.max_bytes:
+                return  # someone else just rotated it
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if self.backups:
+                os.replace(self.path, self.path + ".1")
+            else:
+                os.truncate(self.path, 0)
+        self._open()
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        super().close()
+
+
+class _Listener(QueueListener):
+    def dequeue(self, block):
+        # The queue has run dry: write out the batch before waiting.
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+
+class _AsyncHandler(QueueHandler):
+    """Hands records to a listener thread, started once per process."""
+
+    def __init__(self, make_handler):
+        super().__init__(None)
+        self.make_handler = make_handler
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread.
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        self.queue.put_nowait(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork, the parent's queue and buffered lines stay behind.
+            self.queue = queue.SimpleQueue()
+            self.listener = _Listener(self.queue, self.make_handler())
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self._pid = None
+        super().close()
+
+
+_configured = None
+
+
+def configure_logging():
+    """Route the root logger through the JSON-lines queue handler (once)."""
+    global _configured
+    if _configured is not None:
+        return _configured
+    env = os.environ
+    formatter = JsonFormatter(env.get("LOG_PII", "mask"), env.get("LOG_PII_SALT", ""))
+    path = env.get("LOG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "jungmarker.jsonl"))
+
+    def make_handler():
+        if path == "-":
+            handler = logging.StreamHandler(sys.stderr)
+        else:
+            handler = RotatingJsonLinesHandler(
+                path, int(env.get("LOG_MAX_BYTES", 10 * 1024 * 1024)), int(env.get("LOG_BACKUPS", 5)),
+            )
+        handler.setFormatter(formatter)
+        return handler
+
+    _configured = _AsyncHandler(make_handler)
+    root = logging.getLogger()
+    root.addHandler(_configured)
+    root.setLevel(env.get("LOG_LEVEL", "INFO").upper())
+    atexit.register(_configured.close)
+    return _configured
@@ -0,0 +1,284 @@
+"""
+Request instrumentation for the jungmarker.com Flask app, exposed in the
+Prometheus text format.
+
+Every request thread writes only to its own shard (plain ints and lists,
+no locks), and ``/metrics`` merges the shards when it is scraped. Shards
+of threads that have exited are folded into a retired total whenever a new
+thread registers, so the thread-per-connection server doesn't grow the
+shard list without bound, scraped or not.
+
+With a ``shared_dir`` (``serve`` sets ``METRICS_DIR`` for its workers),
+each process also publishes its totals and gauge values to
+``<pid>.json`` there every ``publish_interval`` seconds and at exit, and a
+scrape adds up every file, so whichever worker answers reports the whole
+server. Files of exited workers are folded into ``archive.json``, which
+keeps counters monotonic across worker recycling and reloads.
+"""
+
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+# Upper bounds in seconds; +Inf is implied.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    __slots__ = ("thread", "series", "started", "finished")
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.series = {}  # (route, method, status) -> [bucket counts..., sum, bytes]
+        self.started = 0
+        self.finished = 0
+
+
+class Metrics:
+    """Per-route latency histograms, response bytes, in-flight requests and
+    whatever gauges the app registers."""
+
+    def __init__(self, prefix="jungmarker", shared_dir=None, publish_interval=5.0):
+        self.prefix = prefix
+        self.shared_dir = shared_dir
+        self.publish_interval = publish_interval
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._gauges = []  # (name, help, fn, label)
+        self._lock = threading.Lock()  # shard registration and scrapes only
+        self._publisher_pid = None
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._retire_dead()
+                self._shards.append(shard)
+        return shard
+
+    def _retire_dead(self):
+        # Caller holds self._lock. A dead thread's shard no longer changes.
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                _fold(self._retired, shard)
+        self._shards = live
+
+    def gauge(self, name, help, fn, label=None):
+        """Report ``fn()`` at scrape time: a number, or with ``label`` a
+        ``{label value: number}`` dict."""
+        self._gauges.append((f"{self.prefix}_{name}", help, fn, label))
+
+    def instrument(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _before(self):
+        if self.shared_dir and self._publisher_pid != os.getpid():
+            self._start_publisher()
+        self._shard().started += 1
+        g.metrics_start = time.perf_counter()
+
+    def _after(self, response):
+        elapsed = time.perf_counter() - g.metrics_start
+        rule = request.url_rule
+        key = (rule.rule if rule is not None else "unmatched", request.method, response.status_code)
+        series = self._shard().series
+        row = series.get(key)
+        if row is None:
+            row = series[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        row[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        row[-2] += elapsed
+        row[-1] += response.content_length or 0
+        return response
+
+    def _teardown(self, exc):
+        self._shard().finished += 1
+
+    def _merge(self):
+        with self._lock:
+            self._retire_dead()
+            total = _Shard(None)
+            for shard in (self._retired, *self._shards):
+                _fold(total, shard)
+        return total
+
+    def _gauge_values(self) -> dict:
+        return {name: fn() for name, _, fn, _ in self._gauges}
+
+    # ── Cross-process aggregation ────────────────────────────────────────────
+
+    def _start_publisher(self):
+        with self._lock:
+            if self._publisher_pid == os.getpid():
+                return
+            self._publisher_pid = os.getpid()
+        os.makedirs(self.shared_dir, exist_ok=True)
+        threading.Thread(target=self._publish_loop, name="metrics-publisher", daemon=True).start()
+        atexit.register(self.publish)
+
+    def _publish_loop(self):
+        while True:
+            time.sleep(self.publish_interval)
+            try:
+                self.publish()
+            except Exception:
+                pass  # a full disk mustn't take the worker down; next round retries
+
+    def publish(self):
+        """Write this process's totals to ``<shared_dir>/<pid>.json``."""
+        total = self._merge()
+        _write_json(os.path.join(self.shared_dir, f"{os.getpid()}.json"), {
+            **_dump(total), "gauges": self._gauge_values(),
+        })
+
+    def _collect(self):
+        """Totals and gauge values across every process sharing ``shared_dir``."""
+        self.publish()
+        total, gauges = _Shard(None), {}
+        with open(os.path.join(self.shared_dir, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.shared_dir, "archive.json")
+            archive = _load(_read_json(archive_path) or {})
+            for entry in os.scandir(self.shared_dir):
+                stem = entry.name.removesuffix(".json")
+                if not stem.isdigit():
+                    continue
+                data = _read_json(entry.path)
+                if data is None:
+                    continue
+                if _alive(int(stem)):
+                    _fold(total, _load(data))
+                    _add_gauges(gauges, data.get("gauges", {}))
+                else:
+                    shard = _load(data)
+                    shard.started = shard.finished  # nothing is in flight in a dead worker
+                    _fold(archive, shard)
+                    # Archive first, so a crash in between can't lose the counts.
+                    _write_json(archive_path, _dump(archive))
+                    os.unlink(entry.path)
+        _fold(total, archive)
+        return total, gauges
+
+    def render(self) -> str:
+        if self.shared_dir:
+            total, gauges = self._collect()
+        else:
+            total, gauges = self._merge(), self._gauge_values()
+        p = self.prefix
+        out = [
+            f"# HELP {p}_http_request_duration_seconds Request latency by route, method and status.",
+            f"# TYPE {p}_http_request_duration_seconds histogram",
+        ]
+        for (route, method, status), row in sorted(total.series.items()):
+            labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+            cumulative = 0
+            for le, n in zip((*LATENCY_BUCKETS, "+Inf"), row):
+                cumulative += n
+                out.append(f'{p}_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            out.append(f"{p}_http_request_duration_seconds_sum{{{labels}}} {row[-2]:.6f}")
+            out.append(f"{p}_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+        out += [
+            f"# HELP {p}_http_response_bytes_total Response body bytes by route, method and status.",
+            f"# TYPE {p}_http_response_bytes_total counter",
+        ]
+        for (route, method, status), row in sorted(total.series.items()):
+            labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+            out.append(f"{p}_http_response_bytes_total{{{labels}}} {row[-1]}")
+        out += [
+            f"# HELP {p}_http_requests_in_flight Requests currently being handled.",
+            f"# TYPE {p}_http_requests_in_flight gauge",
+            f"{p}_http_requests_in_flight {total.started - total.finished}",
+        ]
+        for name, help, _, label in self._gauges:
+            out += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            value = gauges.get(name, {} if label else 0)
+            if label is None:
+                out.append(f"{name} {value}")
+            else:
+                out += [f'{name}{{{label}="{_escape(str(k))}"}} {v}' for k, v in sorted(value.items())]
+        return "\n".join(out) + "\n"
+
+
+def _fold(into: _Shard, shard: _Shard):
+    into.started += shard.started
+    into.finished += shard.finished
+    for key, row in list(shard.series.items()):
+        acc = into.series.get(key)
+        if acc is None:
+            into.series[key] = list(row)
+        else:
+            for i, n in enumerate(row):
+                acc[i] += n
+
+
+def _dump(shard: _Shard) -> dict:
+    return {
+        "started": shard.started,
+        "finished": shard.finished,
+        "series": [[*key, row] for key, row in shard.series.items()],
+    }
+
+
+def _load(data: dict) -> _Shard:
+    shard = _Shard(None)
+    shard.started = data.get("started", 0)
+    shard.finished = data.get("finished", 0)
+    shard.series = {(route, method, status): row for route, method, status, row in data.get("series", ())}
+    return shard
+
+
+def _add_gauges(into: dict, values: dict):
+    for name, value in values.items():
+        if isinstance(value, dict):
+            acc = into.setdefault(name, {})
+            for k, v in value.items():
+                acc[k] = acc.get(k, 0) + v
+        else:
+            into[name] = into.get(name, 0) + value
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data):
+    # Atomic, so a concurrent scrape never reads half a file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
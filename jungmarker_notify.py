@@ -0,0 +1,513 @@
+"""
+Lead notification fan-out: email to the agent, an SMS auto-reply to the lead and
+a CRM (Airtable) record, the same three actions api-server.mjs performs.
+
+Everything runs off the request path. ``Notifier.notify`` only appends the
+lead to each channel's queue; every channel has one worker thread that owns
+a persistent connection (SMTP session or HTTP keep-alive), retries failures
+with exponential backoff and jitter, and writes leads that still fail to a
+JSON-lines dead-letter file. The CRM channel coalesces leads into
+Airtable batch requests under a requests-per-second budget.
+
+Transports are plain objects with ``send``/``request`` and ``close`` so they
+can be pointed at a local SMTP debug server (``SMTP_HOST=localhost
+SMTP_PORT=1025``) or a fake HTTP endpoint (``TWILIO_API_BASE``,
+``AIRTABLE_API_BASE``).
+"""
+
+import atexit
+import base64
+from datetime import datetime, timezone
+from email.message import EmailMessage
+import heapq
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import smtplib
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from jungmarker_leads import interest_code, phone_key
+from jungmarker_limits import SharedRateLimiter, TokenBucketLimiter
+
+log = logging.getLogger(__name__)
+
+NICK_EMAIL = "nickjungmarker@lnf.com"
+NICK_PHONE_DISPLAY = "(301) 875-7182"
+
+# Airtable's create endpoint takes at most this many records per request.
+AIRTABLE_MAX_BATCH = 10
+
+# Lead interest code -> Airtable "Type", as in api-server.mjs.
+CRM_TYPES = {"buy": "Buyer", "sell": "Seller", "invest": "Investor", "cma": "CMA", "other": "Other"}
+
+
+class PermanentError(Exception):
+    """A failure that retrying cannot fix (bad request, unusable phone...)."""
+
+
+class TransientError(Exception):
+    """A failure worth retrying (network error, 5xx, rate limited)."""
+
+
+def e164(phone: str):
+    digits = phone_key(phone)
+    return f"+1{digits}" if len(digits) == 10 else None
+
+
+# ── Transports ───────────────────────────────────────────────────────────────
+
+class SmtpTransport:
+    """One SMTP session kept open across messages, reopened when dropped."""
+
+    def __init__(self, host, port, user="", password="", use_ssl=False, starttls=False, timeout=20):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.use_ssl, self.starttls = use_ssl, starttls
+        self.timeout = timeout
+        self._smtp = None
+
+    def _connect(self):
+        cls = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = cls(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def send(self, msg: EmailMessage):
+        for attempt in (1, 2):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, OSError) as e:
+                # A pooled session the server timed out; reconnect once.
+                self.close()
+                if attempt == 2:
+                    raise TransientError(f"smtp: {e}") from e
+            except smtplib.SMTPResponseException as e:
+                self.close()
+                err = TransientError if 400 <= e.smtp_code < 500 else PermanentError
+                raise err(f"smtp {e.smtp_code}: {e.smtp_error!r}") from e
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+class HttpTransport:
+    """A keep-alive HTTP(S) connection to one origin, reopened when dropped."""
+
+    def __init__(self, base_url: str, headers=None, timeout=20):
+        parts = urlsplit(base_url)
+        self.scheme, self.netloc = parts.scheme, parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.netloc, timeout=self.timeout)
+
+    def request(self, method, path, body=b"", headers=None):
+        """Return ``(status, parsed JSON or None)``; 429/5xx raise TransientError.
+
+        The request is only resent on the spot when a reused keep-alive
+        connection turns out to have been closed by the server, which never
+        saw it. Any other failure (a read timeout, say) may come after the
+        server acted on the POST, so it goes back to the worker's backoff
+        rather than being fired again at once.
+        """
+        hdrs = {**self.headers, **(headers or {})}
+        while True:
+            reused = self._conn is not None
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                self._conn.request(method, self.prefix + path, body=body, headers=hdrs)
+                resp = self._conn.getresponse()
+                raw = resp.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if not (reused and isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError))):
+                    raise TransientError(f"{self.netloc}: {e}") from e
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        if resp.status == 429 or resp.status >= 500:
+            raise TransientError(f"{self.netloc} {resp.status}: {raw[:200]!r}")
+        if resp.status >= 400:
+            raise PermanentError(f"{self.netloc} {resp.status}: {raw[:200]!r}")
+        return resp.status, data
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# ── Channels ─────────────────────────────────────────────────────────────────
+
+class EmailChannel:
+    """Lead details to the agent's ``agent_email``, or to ``to`` when set."""
+
+    name = "email"
+
+    def __init__(self, transport: SmtpTransport, sender: str, to: str = None):
+        self.transport, self.sender, self.to = transport, sender, to
+
+    def send(self, lead: dict):
+        kind = CRM_TYPES[interest_code(lead["interest"])]
+        name = f"{lead['first_name']} {lead['last_name']}".strip()
+        msg = EmailMessage()
+        try:
+            msg["From"] = f'"{lead.get("agent_name", "Nick Jungmarker")} Site" <{self.sender}>'
+            msg["To"] = self.to or lead.get("agent_email") or NICK_EMAIL
+            msg["Subject"] = f"New Contact Form Lead — {name} ({kind})"
+        except ValueError as e:  # e.g. a line break in a header; resending won't help
+            raise PermanentError(f"unusable email header: {e}") from e
+        msg.set_content("\n".join([
+            f"Name:    {name}",
+            f"Email:   {lead['email']}",
+            f"Phone:   {lead['phone'] or '—'}",
+            f"Type:    {kind}",
+            f"Message: {lead['message'] or '—'}",
+            "",
+            f"Submitted via {lead.get('agent_site') or 'jungmarker.com'}",
+        ]))
+        self.transport.send(msg)
+
+
+class SmsChannel:
+    """Twilio auto-reply to the lead's own phone number."""
+
+    name = "sms"
+
+    def __init__(self, transport: HttpTransport, account_sid: str, from_number: str):
+        self.transport, self.account_sid, self.from_number = transport, account_sid, from_number
+
+    @classmethod
+    def twilio(cls, account_sid, auth_token, from_number, base_url="https://api.twilio.com"):
+        creds = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        return cls(HttpTransport(base_url, {"Authorization": f"Basic {creds}"}), account_sid, from_number)
+
+    def wants(self, lead: dict) -> bool:
+        return bool(lead["phone"].strip())
+
+    def send(self, lead: dict):
+        to = e164(lead["phone"])
+        if to is None:
+            raise PermanentError(f"could not normalize phone {lead['phone']!r}")
+        body = (
+            f"Hi {lead['first_name']}! This is {lead.get('agent_name', 'Nick Jungmarker')}, "
+            f"your {lead.get('agent_role', 'Maryland REALTOR®')}. "
+            f"I just received your message and will be reaching out to you very soon. "
+            f"Feel free to call or text me anytime at {lead.get('agent_phone', NICK_PHONE_DISPLAY)}. Talk soon!"
+        )
+        self.transport.request(
+            "POST", f"/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+            body=urlencode({"To": to, "From": self.from_number, "Body": body}).encode(),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+
+
+def crm_fields(lead: dict) -> dict:
+    """A lead as an Airtable record, matching api-server.mjs."""
+    return {
+        "First Name": lead["first_name"],
+        "Last Name": lead["last_name"],
+        "Email": lead["email"],
+        "Phone": lead["phone"],
+        "Type": CRM_TYPES[interest_code(lead["interest"])],
+        "Message": lead["message"],
+        "Status": "Cold/Long Term",
+    }
+
+
+class CrmChannel:
+    """Airtable records, created up to ``AIRTABLE_MAX_BATCH`` per request.
+
+    The worker hands over whatever leads arrived within ``batch_window``
+    seconds (or a full batch, whichever comes first), and every request
+    waits for its slot under a ``requests_per_second`` budget, so a campaign
+    burst queues up instead of tripping Airtable's per-base rate limit.
+    With ``rate_file`` the budget is shared by every process on the host
+    using that file (all ``serve`` workers); without it, it is per process.
+    """
+
+    name = "crm"
+
+    def __init__(self, transport: HttpTransport, base: str, table: str,
+                 batch_window: float = 0.25, requests_per_second: float = 5.0,
+                 rate_file: str = None):
+        self.transport, self.path = transport, f"/v0/{base}/{table}"
+        self.batch_size = AIRTABLE_MAX_BATCH
+        self.batch_window = batch_window
+        if rate_file:
+            self._budget = SharedRateLimiter(rate_file, requests_per_second)
+        else:
+            self._budget = TokenBucketLimiter(requests_per_second, burst=1, max_keys=1)
+
+    @classmethod
+    def airtable(cls, token, base, table, base_url="https://api.airtable.com", **kwargs):
+        return cls(HttpTransport(base_url, {"Authorization": f"Bearer {token}"}), base, table, **kwargs)
+
+    def send(self, lead: dict):
+        error = self.send_batch([lead])[0]
+        if error is not None:
+            raise error
+
+    def send_batch(self, leads: list) -> list:
+        """Create ``leads``; return one exception (or None) per lead, in order.
+
+        Airtable rejects a whole batch when one record is invalid, so a
+        rejected batch is split in half until the bad records are isolated
+        and only those are reported as permanent failures.
+        """
+        self._budget.wait(None)
+        body = json.dumps({"records": [{"fields": crm_fields(l)} for l in leads]}).encode()
+        try:
+            _, data = self.transport.request(
+                "POST", self.path, body=body, headers={"Content-Type": "application/json"},
+            )
+        except PermanentError as e:
+            if len(leads) == 1:
+                return [e]
+            mid = len(leads) // 2
+            return self.send_batch(leads[:mid]) + self.send_batch(leads[mid:])
+        except TransientError as e:
+            return [e] * len(leads)
+        records = data.get("records") if isinstance(data, dict) else None
+        created = len(records) if isinstance(records, list) else 0
+        missing = TransientError("record missing from Airtable response")
+        return [None if i < created else missing for i in range(len(leads))]
+
+
+# ── Delivery ─────────────────────────────────────────────────────────────────
+
+class DeadLetters:
+    """Append-only JSON-lines record of notifications that gave up."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, channel: str, payload, error: str, attempts: int):
+        record = {
+            "failed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "channel": channel,
+            "attempts": attempts,
+            "error": error,
+            "payload": payload,
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ChannelWorker:
+    """Delivers one channel's jobs on its own thread, retrying with backoff.
+
+    Jobs wait in a heap ordered by due time, so a lead in backoff never
+    blocks the leads queued behind it.
+    """
+
+    def __init__(self, channel, dead_letters: DeadLetters, max_attempts=6,
+                 base_delay=1.0, max_delay=300.0):
+        self.channel = channel
+        self.dead_letters = dead_letters
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []  # (due, seq, attempts, payload)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+        self._pid = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def put(self, payload, attempts=0, due=0.0):
+        self._ensure_thread()
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, attempts, payload))
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._heap.clear()
+            self._closing = False
+            self._thread = threading.Thread(
+                target=self._run, name=f"notify-{self.channel.name}", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _pop_due(self):
+        """The next due job, or None; called with the condition held."""
+        while self._heap and (self._heap[0][0] <= time.monotonic() or self._closing):
+            if self._closing and self._heap[0][2] > 0:
+                # Shutting down: don't sit out a backoff, park it.
+                _, _, attempts, payload = heapq.heappop(self._heap)
+                self.dead_letters.write(self.channel.name, payload, "shutdown during retry backoff", attempts)
+                continue
+            return heapq.heappop(self._heap)
+        return None
+
+    def _wait(self, deadline=None):
+        timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+        if deadline is not None:
+            timeout = min(deadline - time.monotonic(), timeout if timeout is not None else math.inf)
+        self._cond.wait(max(timeout, 0) if timeout is not None else None)
+
+    def _take(self):
+        """The next due jobs; for a batching channel, everything that comes
+        due within ``batch_window`` of the first, up to ``batch_size``."""
+        size = getattr(self.channel, "batch_size", 1)
+        with self._cond:
+            while (job := self._pop_due()) is None:
+                if self._closing:
+                    return []
+                self._wait()
+            jobs = [job]
+            deadline = time.monotonic() + getattr(self.channel, "batch_window", 0)
+            while len(jobs) < size:
+                job = self._pop_due()
+                if job is not None:
+                    jobs.append(job)
+                elif self._closing or time.monotonic() >= deadline:
+                    break
+                else:
+                    self._wait(deadline)
+            return jobs
+
+    def _run(self):
+        while jobs := self._take():
+            payloads = [payload for _, _, _, payload in jobs]
+            try:
+                if len(payloads) > 1:
+                    errors = self.channel.send_batch(payloads)
+                else:
+                    self.channel.send(payloads[0])
+                    errors = [None]
+            except Exception as e:
+                if not isinstance(e, (TransientError, PermanentError)):
+                    log.exception("%s notification raised unexpectedly", self.channel.name)
+                errors = [e] * len(payloads)
+            for (_, _, attempts, payload), error in zip(jobs, errors):
+                if error is not None:
+                    try:
+                        self._failed(payload, attempts + 1, error)
+                    except Exception:
+                        log.exception("could not requeue or dead-letter a %s notification",
+                                      self.channel.name)
+        self.channel.transport.close()
+
+    def _failed(self, payload, attempts, error):
+        name = self.channel.name
+        if isinstance(error, PermanentError):
+            log.error("%s notification failed permanently: %s", name, error)
+            self.dead_letters.write(name, payload, str(error), attempts)
+        elif attempts >= self.max_attempts:
+            log.error("%s notification gave up after %d attempts: %s", name, attempts, error)
+            self.dead_letters.write(name, payload, str(error), attempts)
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            delay *= random.uniform(0.5, 1.0)
+            log.warning("%s notification failed (attempt %d), retrying in %.1fs: %s",
+                        name, attempts, delay, error)
+            self.put(payload, attempts, time.monotonic() + delay)
+
+    def close(self, timeout=10.0):
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+
+class Notifier:
+    """Fans each lead out to every configured channel."""
+
+    def __init__(self, channels, dead_letter_path: str, **retry):
+        dead_letters = DeadLetters(dead_letter_path)
+        self.workers = [ChannelWorker(c, dead_letters, **retry) for c in channels]
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, dead_letter_path: str) -> "Notifier":
+        """Channels are enabled by the same variables api-server.mjs reads."""
+        env = os.environ
+        channels = []
+        if env.get("GMAIL_USER") or env.get("SMTP_HOST"):
+            host = env.get("SMTP_HOST", "smtp.gmail.com")
+            port = int(env.get("SMTP_PORT", 465 if host == "smtp.gmail.com" else 25))
+            smtp = SmtpTransport(
+                host, port, env.get("GMAIL_USER", ""), env.get("GMAIL_APP_PASSWORD", ""),
+                use_ssl=port == 465, starttls=port == 587,
+            )
+            sender = env.get("GMAIL_USER") or env.get("NOTIFY_FROM", "site@jungmarker.com")
+            channels.append(EmailChannel(smtp, sender, env.get("NOTIFY_EMAIL_TO")))
+        if env.get("TWILIO_ACCOUNT_SID"):
+            channels.append(SmsChannel.twilio(
+                env["TWILIO_ACCOUNT_SID"], env.get("TWILIO_AUTH_TOKEN", ""),
+                env.get("TWILIO_FROM_NUMBER", ""),
+                env.get("TWILIO_API_BASE", "https://api.twilio.com"),
+            ))
+        if env.get("AIRTABLE_TOKEN"):
+            base = env.get("AIRTABLE_BASE", "appWApjlYYxfe3Vj2")
+            # Airtable's limit is per base, so every process sending to this
+            # base on this host shares one budget (AIRTABLE_RPS in total).
+            rate_file = env.get("AIRTABLE_RATE_FILE") or os.path.join(
+                tempfile.gettempdir(), f"jungmarker-airtable-{base}.rate",
+            )
+            channels.append(CrmChannel.airtable(
+                env["AIRTABLE_TOKEN"],
+                base,
+                env.get("AIRTABLE_TABLE", "tbl46E8jx9l8fQWay"),
+                env.get("AIRTABLE_API_BASE", "https://api.airtable.com"),
+                batch_window=float(env.get("AIRTABLE_BATCH_WINDOW", 0.25)),
+                requests_per_second=float(env.get("AIRTABLE_RPS", 5)),
+                rate_file=rate_file,
+            ))
+        return cls(channels, env.get("NOTIFY_DEAD_LETTER", dead_letter_path))
+
+    @property
+    def pending(self) -> int:
+        return sum(w.pending for w in self.workers)
+
+    def notify(self, lead: dict):
+        for worker in self.workers:
+            wants = getattr(worker.channel, "wants", None)
+            if wants is None or wants(lead):
+                worker.put(lead)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
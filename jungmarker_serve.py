@@ -0,0 +1,270 @@
+"""
+Pre-forking production server for the jungmarker.com Flask app.
+
+The master binds the listening socket once and starts ``workers`` children
+that all accept on it. Each child is a fresh interpreter (fork, then exec of
+this file), so it imports the app and every module the app uses from disk
+rather than inheriting whatever the master had loaded. Each worker runs a
+threaded Werkzeug server with HTTP/1.1 keep-alive, so one slow client ties
+up a thread, not the site.
+
+Signals to the master:
+  HUP       start a fresh generation of workers and, once every one of them
+            has imported the app and reported ready over its pipe, gracefully
+            stop the old one; the socket never closes, so no connection is
+            refused. If a new worker dies before it is ready the reload is
+            abandoned and the old generation keeps serving. (Changes to this
+            file itself need a full restart.)
+  TERM/INT  stop all workers gracefully and exit
+
+Workers recycle themselves after ``max_requests`` requests (with jitter) and
+the master replaces any worker that exits.
+
+Unless ``METRICS_DIR`` is already set, the master creates a temporary one
+for the workers to pool their request metrics in (see jungmarker_metrics)
+and removes it on exit.
+"""
+
+import importlib
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wsgi import ClosingIterator
+
+from jungmarker_logging import configure_logging
+
+# Seconds an idle keep-alive connection may hold a worker thread.
+KEEPALIVE_TIMEOUT = 5
+# Seconds a stopping worker waits for in-flight requests to finish.
+GRACEFUL_TIMEOUT = 30
+
+_SCRIPT = os.path.abspath(__file__)
+
+
+class _RequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def log_request(self, *args, **kwargs):
+        pass  # the app does its own logging
+
+
+class _Worker:
+    """One forked child: serves until told to stop or its request budget ends."""
+
+    def __init__(self, sock, app_module, max_requests, ready_fd=None):
+        self.sock = sock
+        self.app_module = app_module
+        self.ready_fd = ready_fd  # written to once the app is imported and listening
+        self.max_requests = max_requests + random.randint(0, max(1, max_requests // 10)) if max_requests else 0
+        self.handled = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.server = None
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.in_flight += 1
+            self.handled += 1
+            recycle = self.max_requests and self.handled == self.max_requests
+        if recycle:
+            self.stop()
+        try:
+            return ClosingIterator(self.app(environ, start_response), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stop(self, *_):
+        if not self._stopping.is_set():
+            self._stopping.set()
+            if self.server is None:
+                return  # still importing the app; run() won't start serving
+            # shutdown() blocks until serve_forever returns, so not from its thread.
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.app = importlib.import_module(self.app_module).app
+        host, port = self.sock.getsockname()[:2]
+        self.server = make_server(
+            host, port, self, threaded=True,
+            request_handler=_RequestHandler, fd=self.sock.fileno(),
+        )
+        if self.ready_fd is not None:
+            os.write(self.ready_fd, b"1")
+            os.close(self.ready_fd)
+        if self._stopping.is_set():
+            return
+        self.server.serve_forever()
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+class Arbiter:
+    """The master process: owns the socket and keeps ``workers`` children alive."""
+
+    def __init__(self, app_module, host, port, workers, max_requests):
+        self.app_module = app_module
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.generation = 0
+        self.children = {}  # pid -> generation
+        self._starting = {}  # pid -> ready pipe (None once it hit EOF), until ready
+        self._retiring = []  # the previous generation, stopped once the new one is ready
+        self._reload = False
+        self._stop = False
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(1024)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self):
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if not pid:
+            try:
+                os.close(ready_r)
+                os.set_inheritable(ready_w, True)
+                os.execv(sys.executable, [
+                    sys.executable, _SCRIPT, "worker", self.app_module,
+                    str(self.sock.fileno()), str(ready_w), str(self.max_requests),
+                ])
+            finally:
+                os._exit(127)
+        os.close(ready_w)
+        os.set_blocking(ready_r, False)
+        self.children[pid] = self.generation
+        self._starting[pid] = ready_r
+
+    def _poll_ready(self):
+        for pid, fd in list(self._starting.items()):
+            if fd is None:
+                continue
+            try:
+                data = os.read(fd, 1)
+            except BlockingIOError:
+                continue
+            os.close(fd)
+            if data:
+                del self._starting[pid]
+            else:
+                self._starting[pid] = None  # exited before it was ready
+        if self._retiring and not any(
+            self.children.get(pid) == self.generation for pid in self._starting
+        ):
+            self._signal(self._retiring, signal.SIGTERM)
+            self._retiring = []
+
+    def _start_generation(self):
+        self._retiring += [pid for pid in self.children if pid not in self._retiring]
+        self.generation += 1
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _abandon_generation(self):
+        print(f"  * generation {self.generation} failed to start; "
+              "keeping the running workers", file=sys.stderr)
+        self._signal([p for p, g in self.children.items() if g == self.generation], signal.SIGTERM)
+        self.generation = max(self.children[p] for p in self._retiring if p in self.children)
+        self._retiring = []
+
+    def _signal(self, pids, sig):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            generation = self.children.pop(pid, None)
+            started = pid not in self._starting
+            fd = self._starting.pop(pid, None)
+            if fd is not None:
+                os.close(fd)
+            if generation == self.generation and not self._stop:
+                if not started and any(p in self.children for p in self._retiring):
+                    self._abandon_generation()
+                    continue
+                if os.waitstatus_to_exitcode(status) != 0:
+                    time.sleep(1)  # don't spin if the app fails to import
+                self._spawn()
+
+    def run(self):
+        self.sock = self._bind()
+        metrics_dir = None
+        if not os.environ.get("METRICS_DIR"):
+            metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="jungmarker-metrics-")
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "_reload", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_stop", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "_stop", True))
+        for _ in range(self.workers):
+            self._spawn()
+        print(f"  * jungmarker.com serving on http://{self.host}:{self.port} "
+              f"with {self.workers} workers (pid {os.getpid()})")
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self._start_generation()
+            self._poll_ready()
+            self._reap()
+            time.sleep(0.2)
+        self._signal(list(self.children), signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        self._signal(list(self.children), signal.SIGKILL)
+        for fd in self._starting.values():
+            if fd is not None:
+                os.close(fd)
+        self.sock.close()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def serve(app_module="jungmarker_site", host="0.0.0.0", port=5002,
+          workers=None, max_requests=10000):
+    Arbiter(app_module, host, port, workers or os.cpu_count() or 1, max_requests).run()
+
+
+def _worker_main(app_module, sock_fd, ready_fd, max_requests):
+    # Run in the exec'd child. Returning lets the interpreter exit normally,
+    # so atexit hooks such as the lead store drain run first. Logging is
+    # set up before the app import so anything logged while loading lands too.
+    configure_logging()
+    sock = socket.socket(fileno=int(sock_fd))
+    _Worker(sock, app_module, int(max_requests), int(ready_fd)).run()
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["worker"]:
+    _worker_main(*sys.argv[2:])
@@ -3,18 +3,105 @@ jungmarker.com — Nick Jungmarker Real Estate Website
 Standalone Flask app on port 5002.
 """
 
-from flask import Flask, render_template_string, request, jsonify
+import argparse
+import contextlib
+from collections import OrderedDict
+from dataclasses import dataclass
+import hmac
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import json
+import logging
+import math
 import os
+import re
+import sys
+import threading
+import time
+
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
+from markupsafe import Markup
+
+from jungmarker_agents import AgentRegistry
+from jungmarker_cma import MAX_RADIUS_KM, CompCache, resolve_subject
+from jungmarker_files import PublicFiles
+from jungmarker_images import FORMATS, ImageService
+from jungmarker_import import import_listings
+from jungmarker_leads import (
+    EXPORT_FORMATS, INTEREST_CODES, LeadStore, clean_lead, email_key, export_leads,
+    get_person, parse_time, phone_key, query_leads,
+)
+from jungmarker_limits import DedupFilter, TokenBucketLimiter
+from jungmarker_listings import STATUSES, ListingIndex, SuggestIndex
+from jungmarker_logging import configure_logging
+from jungmarker_metrics import Metrics
+from jungmarker_notify import Notifier
+from jungmarker_stats import StatsCache, short_money
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone covers every browser we see
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+app = Flask(__name__, static_folder=None)
+
+# Behind nginx every request comes from 127.0.0.1. TRUSTED_PROXIES is how
+# many proxies in front of us to believe about X-Forwarded-For/-Proto/-Host,
+# so request.remote_addr (and the /contact rate limit) sees the real client.
+# Leave it unset when clients connect directly, or they could spoof it.
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES, x_host=TRUSTED_PROXIES,
+    )
 
-app = Flask(__name__)
+HERE = os.path.dirname(os.path.abspath(__file__))
+lead_store = LeadStore.from_env(os.path.join(HERE, "leads.db"))
+# Email / SMS / CRM fan-out, configured by the same env vars as api-server.mjs.
+notifier = Notifier.from_env(os.path.join(HERE, "notify-dead-letter.jsonl"))
+
+# One process serves every agent in agents/; the Host header picks which.
+agents = AgentRegistry(
+    os.environ.get("AGENTS_DIR", os.path.join(HERE, "agents")),
+    HERE,
+    default=os.environ.get("AGENT_DEFAULT", "jungmarker"),
+    default_listings=os.environ.get("LISTINGS_PATH", os.path.join(HERE, "public", "listings.json")),
+)
+images = ImageService(
+    os.path.join(HERE, "public"),
+    os.environ.get("IMAGE_CACHE_DIR", os.path.join(HERE, ".image-cache")),
+)
+
+# /contact abuse controls: per-IP token bucket (CONTACT_RATE_PER_MIN=0 turns
+# it off), plus a short window in which a repeat of the same (email, phone,
+# message) is acknowledged but dropped.
+CONTACT_RATE_PER_MIN = float(os.environ.get("CONTACT_RATE_PER_MIN", 10))
+contact_limiter = TokenBucketLimiter(
+    rate=CONTACT_RATE_PER_MIN / 60,
+    burst=int(os.environ.get("CONTACT_BURST", 10)),
+) if CONTACT_RATE_PER_MIN else None
+contact_dedup = DedupFilter(window=float(os.environ.get("CONTACT_DEDUP_WINDOW", 120)))
+
+# Set by ``serve`` so /metrics adds up every worker, not just the one that answers.
+metrics = Metrics(shared_dir=os.environ.get("METRICS_DIR"))
+metrics.instrument(app)
+metrics.gauge("lead_queue_depth", "Leads waiting for the SQLite writer.", lambda: lead_store.pending)
+metrics.gauge(
+    "notify_queue_depth", "Notifications waiting to be delivered, by channel.",
+    lambda: {w.channel.name: w.pending for w in notifier.workers}, label="channel",
+)
 
 SITE_HTML = """<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>Nick Jungmarker — Real Estate Agent | Maryland</title>
-  <meta name="description" content="Nick Jungmarker is a top real estate agent in Maryland specializing in buying, selling, and investment properties. Expert local market knowledge.">
+  <title>{{ agent.page_title }}</title>
+  <meta name="description" content="{{ agent.description }}">
 
   <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&family=Playfair+Display:wght@400;600;700&display=swap" rel="stylesheet">
   <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css">
@@ -175,11 +262,12 @@ SITE_HTML = """<!DOCTYPE html>
     .listing-card:hover { transform: translateY(-4px); box-shadow: 0 20px 48px rgba(0,0,0,.4); }
     .listing-img { height: 200px; background: linear-gradient(135deg, #162032 0%, #1a3a5c 100%); display: flex; align-items: center; justify-content: center; position: relative; }
     .listing-img i { font-size: 48px; color: rgba(201,168,76,.3); }
+    .listing-img img { width: 100%; height: 100%; object-fit: cover; }
     .listing-badge { position: absolute; top: 12px; left: 12px; background: var(--gold); color: var(--navy); font-size: 11px; font-weight: 700; padding: 4px 10px; border-radius: 4px; text-transform: uppercase; letter-spacing: .5px; }
     .listing-body { padding: 20px; }
     .listing-price { font-size: 22px; font-weight: 800; color: var(--gold); margin-bottom: 4px; }
     .listing-address { font-size: 14px; font-weight: 600; color: var(--white); margin-bottom: 12px; }
-    .listing-details { display: flex; gap: 16px; }
+    .listing-details { display: flex; flex-wrap: wrap; gap: 8px 16px; }
     .listing-detail { font-size: 13px; color: rgba(255,255,255,.5); display: flex; align-items: center; gap: 5px; }
     .listing-detail i { color: var(--gold); font-size: 13px; }
     .listings-cta { text-align: center; margin-top: 48px; }
@@ -253,7 +341,7 @@ SITE_HTML = """<!DOCTYPE html>
 
   <!-- ── NAV ── -->
   <nav>
-    <div class="nav-logo">Nick <span>Jungmarker</span></div>
+    <div class="nav-logo">{{ agent.first_name }} <span>{{ agent.last_name }}</span></div>
     <ul class="nav-links">
       <li><a href="#about">About</a></li>
       <li><a href="#services">Services</a></li>
@@ -273,7 +361,7 @@ SITE_HTML = """<!DOCTYPE html>
     <div class="hero-content">
       <div class="hero-eyebrow">
         <i class="bi bi-geo-alt-fill"></i>
-        Maryland Real Estate Expert
+        {{ agent.hero_eyebrow }}
       </div>
       <h1 class="hero-title">
         Your Home.<br>
@@ -281,7 +369,7 @@ SITE_HTML = """<!DOCTYPE html>
         My Promise.
       </h1>
       <p class="hero-sub">
-        Whether you're buying your first home, selling for top dollar, or investing in Maryland real estate — I'll guide you through every step with honesty, expertise, and results.
+        {{ agent.hero_sub }}
       </p>
       <div class="hero-btns">
         <a href="#contact" class="btn-primary-gold">
@@ -294,16 +382,18 @@ SITE_HTML = """<!DOCTYPE html>
     </div>
 
     <div class="hero-stats">
-      <div class="stat-item"><div class="stat-num">150+</div><div class="stat-label">Homes Sold</div></div>
-      <div class="stat-item"><div class="stat-num">$48M</div><div class="stat-label">Sales Volume</div></div>
-      <div class="stat-item"><div class="stat-num">5★</div><div class="stat-label">Average Rating</div></div>
-      <div class="stat-item"><div class="stat-num">8+</div><div class="stat-label">Years Experience</div></div>
+      {{ hero_stats_html }}
+      {%- for stat in agent.stats %}
+      <div class="stat-item"><div class="stat-num">{{ stat.num }}</div><div class="stat-label">{{ stat.label }}</div></div>
+      {%- endfor %}
     </div>
 
+    {%- if agent.landmark %}
     <div class="bmore-badge">
       <i class="bi bi-water"></i>
-      <span>Inner Harbor</span>
+      <span>{{ agent.landmark }}</span>
     </div>
+    {%- endif %}
   </section>
 
   <!-- ── ABOUT ── -->
@@ -311,23 +401,22 @@ SITE_HTML = """<!DOCTYPE html>
     <div class="about-grid">
       <div class="about-photo">
         <div class="about-photo-frame"><i class="bi bi-person-fill"></i></div>
-        <div class="about-photo-badge"><strong>#1</strong><span>Top Producer<br>2024</span></div>
+        {%- if agent.badge %}
+        <div class="about-photo-badge"><strong>{{ agent.badge.headline }}</strong><span>{% for line in agent.badge.lines %}{% if not loop.first %}<br>{% endif %}{{ line }}{% endfor %}</span></div>
+        {%- endif %}
       </div>
       <div class="about-text">
-        <div class="section-eyebrow">About Nick</div>
+        <div class="section-eyebrow">About {{ agent.first_name }}</div>
         <h2 class="section-title">Dedicated to Getting You the Best Outcome</h2>
-        <p style="font-size:15px;color:var(--gray);line-height:1.8;margin-bottom:16px">
-          I'm Nick Jungmarker, a licensed Maryland REALTOR® with a passion for helping families find their perfect home and sellers maximize their equity. I specialize in the greater Maryland market — from Baltimore County to Montgomery County and everywhere in between.
-        </p>
-        <p style="font-size:15px;color:var(--gray);line-height:1.8;margin-bottom:28px">
-          My approach is simple: I treat every client like my only client. I combine deep local market knowledge, aggressive negotiation, and cutting-edge marketing to ensure you get the best possible result — whether you're buying, selling, or investing.
+        {%- for paragraph in agent.about %}
+        <p style="font-size:15px;color:var(--gray);line-height:1.8;margin-bottom:{{ 28 if loop.last else 16 }}px">
+          {{ paragraph }}
         </p>
+        {%- endfor %}
         <div class="about-credentials">
-          <div class="credential-chip"><i class="bi bi-patch-check-fill"></i> Licensed REALTOR®</div>
-          <div class="credential-chip"><i class="bi bi-star-fill"></i> Bright MLS Certified</div>
-          <div class="credential-chip"><i class="bi bi-house-heart-fill"></i> First-Time Buyer Specialist</div>
-          <div class="credential-chip"><i class="bi bi-graph-up-arrow"></i> Investment Properties</div>
-          <div class="credential-chip"><i class="bi bi-building"></i> Maryland Licensed</div>
+          {%- for c in agent.credentials %}
+          <div class="credential-chip"><i class="bi bi-{{ c.icon }}"></i> {{ c.text }}</div>
+          {%- endfor %}
         </div>
       </div>
     </div>
@@ -345,7 +434,7 @@ SITE_HTML = """<!DOCTYPE html>
       <div class="service-card"><div class="service-icon"><i class="bi bi-currency-dollar"></i></div><h3>Selling Your Home</h3><p>Professional photography, targeted digital marketing, open houses, and expert pricing strategy to sell your home fast and for top dollar. Average 97.8% list-to-sale ratio.</p></div>
       <div class="service-card"><div class="service-icon"><i class="bi bi-building-gear"></i></div><h3>Investment Properties</h3><p>Identify high-yield rental properties and fix-and-flip opportunities. I analyze cap rates, cash flow, and appreciation potential to help you build lasting wealth through real estate.</p></div>
       <div class="service-card"><div class="service-icon"><i class="bi bi-people-fill"></i></div><h3>First-Time Buyers</h3><p>Buying your first home is exciting — and a little overwhelming. I'll walk you through every step: pre-approval, home search, inspection, negotiation, and closing.</p></div>
-      <div class="service-card"><div class="service-icon"><i class="bi bi-arrow-repeat"></i></div><h3>Relocations</h3><p>Moving to Maryland or leaving the area? I coordinate seamless moves for families and executives, handling all the logistics from neighborhood tours to closing coordination.</p></div>
+      <div class="service-card"><div class="service-icon"><i class="bi bi-arrow-repeat"></i></div><h3>Relocations</h3><p>Moving to {{ agent.region }} or leaving the area? I coordinate seamless moves for families and executives, handling all the logistics from neighborhood tours to closing coordination.</p></div>
       <div class="service-card"><div class="service-icon"><i class="bi bi-chat-square-dots-fill"></i></div><h3>Free Market Analysis</h3><p>Wondering what your home is worth? I'll provide a detailed Comparative Market Analysis (CMA) at no charge — with zero obligation and no pressure.</p></div>
     </div>
   </section>
@@ -358,9 +447,7 @@ SITE_HTML = """<!DOCTYPE html>
       <p class="section-sub" style="margin:0 auto">A selection of current and recent properties. Contact me for the full list.</p>
     </div>
     <div class="listings-grid">
-      <div class="listing-card"><div class="listing-img"><i class="bi bi-house-fill"></i><span class="listing-badge">For Sale</span></div><div class="listing-body"><div class="listing-price">$549,000</div><div class="listing-address">4 Bed Colonial — Ellicott City, MD</div><div class="listing-details"><div class="listing-detail"><i class="bi bi-door-closed"></i> 4 Beds</div><div class="listing-detail"><i class="bi bi-droplet"></i> 2.5 Baths</div><div class="listing-detail"><i class="bi bi-grid"></i> 2,840 sqft</div></div></div></div>
-      <div class="listing-card"><div class="listing-img"><i class="bi bi-house-fill"></i><span class="listing-badge">Just Listed</span></div><div class="listing-body"><div class="listing-price">$389,000</div><div class="listing-address">3 Bed Townhome — Bel Air, MD</div><div class="listing-details"><div class="listing-detail"><i class="bi bi-door-closed"></i> 3 Beds</div><div class="listing-detail"><i class="bi bi-droplet"></i> 2 Baths</div><div class="listing-detail"><i class="bi bi-grid"></i> 1,920 sqft</div></div></div></div>
-      <div class="listing-card"><div class="listing-img"><i class="bi bi-house-fill"></i><span class="listing-badge" style="background:#10b981">Sold</span></div><div class="listing-body"><div class="listing-price">$672,500</div><div class="listing-address">5 Bed Estate — Lutherville, MD</div><div class="listing-details"><div class="listing-detail"><i class="bi bi-door-closed"></i> 5 Beds</div><div class="listing-detail"><i class="bi bi-droplet"></i> 3 Baths</div><div class="listing-detail"><i class="bi bi-grid"></i> 3,600 sqft</div></div></div></div>
+      {{ listings_html }}
     </div>
     <div class="listings-cta"><a href="#contact" class="btn-primary-gold"><i class="bi bi-search"></i> See All Available Properties</a></div>
   </section>
@@ -373,9 +460,9 @@ SITE_HTML = """<!DOCTYPE html>
       <p class="section-sub" style="margin:0 auto">Real results from real people.</p>
     </div>
     <div class="testimonials-grid">
-      <div class="testimonial-card"><div class="testimonial-stars">★★★★★</div><p class="testimonial-text">"Nick sold our house in just 6 days — $14,000 over asking price. His marketing strategy was unlike anything we'd seen before. Professional, responsive, and genuinely cares about his clients."</p><div class="testimonial-author"><div class="author-avatar"><i class="bi bi-person-fill"></i></div><div><div class="author-name">Sarah & Mike T.</div><div class="author-sub">Sold in Towson, MD</div></div></div></div>
-      <div class="testimonial-card"><div class="testimonial-stars">★★★★★</div><p class="testimonial-text">"As a first-time buyer, I was intimidated by the whole process. Nick made it seamless and stress-free. He found us a house that checked every box and negotiated $22K off the price."</p><div class="testimonial-author"><div class="author-avatar"><i class="bi bi-person-fill"></i></div><div><div class="author-name">James & Priya K.</div><div class="author-sub">Bought in Columbia, MD</div></div></div></div>
-      <div class="testimonial-card"><div class="testimonial-stars">★★★★★</div><p class="testimonial-text">"We used Nick for both buying and selling. He's the most knowledgeable agent I've worked with in 20 years of real estate investing. I won't use anyone else in Maryland."</p><div class="testimonial-author"><div class="author-avatar"><i class="bi bi-person-fill"></i></div><div><div class="author-name">Robert D.</div><div class="author-sub">Investor, Baltimore County</div></div></div></div>
+      {%- for t in agent.testimonials %}
+      <div class="testimonial-card"><div class="testimonial-stars">★★★★★</div><p class="testimonial-text">"{{ t.text }}"</p><div class="testimonial-author"><div class="author-avatar"><i class="bi bi-person-fill"></i></div><div><div class="author-name">{{ t.author }}</div><div class="author-sub">{{ t.sub }}</div></div></div></div>
+      {%- endfor %}
     </div>
   </section>
 
@@ -387,22 +474,25 @@ SITE_HTML = """<!DOCTYPE html>
         <h2 class="section-title">Let's Talk About<br>Your Real Estate Goals</h2>
         <p class="section-sub">Ready to buy, sell, or just want a free home valuation? I'll get back to you within 2 hours — usually much faster.</p>
         <div class="contact-info-items">
-          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-telephone-fill"></i></div><div><div class="contact-info-label">Phone / Text</div><div class="contact-info-value">(443) 555-0199</div></div></div>
-          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-envelope-fill"></i></div><div><div class="contact-info-label">Email</div><div class="contact-info-value">nick@jungmarker.com</div></div></div>
-          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-geo-alt-fill"></i></div><div><div class="contact-info-label">Service Area</div><div class="contact-info-value">Baltimore, Howard, Harford, Anne Arundel Counties</div></div></div>
-          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-clock-fill"></i></div><div><div class="contact-info-label">Availability</div><div class="contact-info-value">7 days a week, 8am – 8pm</div></div></div>
+          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-telephone-fill"></i></div><div><div class="contact-info-label">Phone / Text</div><div class="contact-info-value">{{ agent.phone }}</div></div></div>
+          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-envelope-fill"></i></div><div><div class="contact-info-label">Email</div><div class="contact-info-value">{{ agent.email }}</div></div></div>
+          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-geo-alt-fill"></i></div><div><div class="contact-info-label">Service Area</div><div class="contact-info-value">{{ agent.service_area }}</div></div></div>
+          <div class="contact-info-item"><div class="contact-info-icon"><i class="bi bi-clock-fill"></i></div><div><div class="contact-info-label">Availability</div><div class="contact-info-value">{{ agent.availability }}</div></div></div>
         </div>
       </div>
       <div>
         <div class="contact-form">
           <h3 style="font-size:20px;font-weight:700;margin-bottom:24px">Send Me a Message</h3>
-          <form id="contactForm" onsubmit="submitForm(event)">
+          <form id="contactForm" data-agent="{{ agent.first_name }}" onsubmit="submitForm(event)">
             <div class="form-row">
               <div class="form-group"><label>First Name</label><input type="text" name="first_name" required placeholder="John"></div>
               <div class="form-group"><label>Last Name</label><input type="text" name="last_name" required placeholder="Smith"></div>
             </div>
             <div class="form-group"><label>Email</label><input type="email" name="email" required placeholder="you@email.com"></div>
-            <div class="form-group"><label>Phone</label><input type="tel" name="phone" placeholder="(443) 555-0100"></div>
+            <div class="form-row">
+              <div class="form-group"><label>Phone</label><input type="tel" name="phone" placeholder="(443) 555-0100"></div>
+              <div class="form-group"><label>ZIP Code</label><input type="text" name="zip" inputmode="numeric" maxlength="10" placeholder="21211"></div>
+            </div>
             <div class="form-group"><label>I'm Interested In</label>
               <select name="interest">
                 <option value="">Select one…</option>
@@ -424,15 +514,15 @@ SITE_HTML = """<!DOCTYPE html>
   <footer>
     <div class="footer-top">
       <div>
-        <div class="footer-logo">Nick <span>Jungmarker</span></div>
-        <p class="footer-desc">Licensed Maryland REALTOR® dedicated to delivering exceptional results for buyers, sellers, and investors across the greater Maryland area.</p>
+        <div class="footer-logo">{{ agent.first_name }} <span>{{ agent.last_name }}</span></div>
+        <p class="footer-desc">{{ agent.footer_desc }}</p>
       </div>
       <div class="footer-col"><h4>Services</h4><a href="#services">Buying</a><a href="#services">Selling</a><a href="#services">Investing</a><a href="#services">Relocations</a><a href="#services">Free CMA</a></div>
-      <div class="footer-col"><h4>Areas</h4><a href="#contact">Baltimore City</a><a href="#contact">Baltimore County</a><a href="#contact">Howard County</a><a href="#contact">Harford County</a><a href="#contact">Anne Arundel</a></div>
-      <div class="footer-col"><h4>Connect</h4><a href="#contact">Contact Me</a><a href="#about">About Nick</a><a href="#testimonials">Reviews</a><a href="#listings">Listings</a></div>
+      <div class="footer-col"><h4>Areas</h4>{% for area in agent.areas %}<a href="#contact">{{ area }}</a>{% endfor %}</div>
+      <div class="footer-col"><h4>Connect</h4><a href="#contact">Contact Me</a><a href="#about">About {{ agent.first_name }}</a><a href="#testimonials">Reviews</a><a href="#listings">Listings</a></div>
     </div>
     <div class="footer-bottom">
-      <div class="footer-copy">© 2025 Nick Jungmarker Real Estate. Licensed in Maryland.</div>
+      <div class="footer-copy">{{ agent.copyright }}</div>
       <div class="footer-social">
         <a href="#" class="social-btn"><i class="bi bi-facebook"></i></a>
         <a href="#" class="social-btn"><i class="bi bi-instagram"></i></a>
@@ -443,7 +533,7 @@ SITE_HTML = """<!DOCTYPE html>
   </footer>
 
   <!-- ── UI SCRIPTS ── -->
-  <script>
+  <script data-asset="ui">
     function toggleMenu() {
       const links = document.querySelector('.nav-links');
       const open = links.style.display === 'flex';
@@ -468,14 +558,14 @@ SITE_HTML = """<!DOCTYPE html>
       btn.innerHTML = '<span style="display:inline-block;width:16px;height:16px;border:2px solid rgba(255,255,255,.3);border-top-color:#c9a84c;border-radius:50%;animation:spin .6s linear infinite"></span> Sending…';
       fetch('/contact', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(Object.fromEntries(new FormData(e.target))) })
         .then(r => r.json())
-        .then(() => { msg.style.display = 'block'; msg.style.color = '#10b981'; msg.innerHTML = '✓ Message sent! Nick will be in touch shortly.'; e.target.reset(); btn.disabled = false; btn.innerHTML = '<i class="bi bi-send-fill"></i> Send Message'; })
+        .then(() => { msg.style.display = 'block'; msg.style.color = '#10b981'; msg.textContent = '✓ Message sent! ' + e.target.dataset.agent + ' will be in touch shortly.'; e.target.reset(); btn.disabled = false; btn.innerHTML = '<i class="bi bi-send-fill"></i> Send Message'; })
         .catch(() => { msg.style.display = 'block'; msg.style.color = '#ef4444'; msg.innerHTML = '✗ Something went wrong — please call directly.'; btn.disabled = false; btn.innerHTML = '<i class="bi bi-send-fill"></i> Send Message'; });
     }
   </script>
   <style>@keyframes spin { to { transform: rotate(360deg); } }</style>
 
   <!-- ── THREE.JS BALTIMORE SKYLINE ── -->
-  <script>
+  <script data-asset="skyline">
   (function initScene() {
     const canvas  = document.getElementById('heroCanvas');
     const section = document.getElementById('hero');
@@ -538,57 +628,88 @@ SITE_HTML = """<!DOCTYPE html>
       [13.2,  3.5, 1.2, 1.0],
     ];
 
-    const windows = [];  // for blinking
-
+    // One InstancedMesh per kind of part: buildings, antennas, beacons and
+    // windows are four draw calls however many windows the skyline has.
+    const WIN_WARM = new THREE.Color(0xffaa44);
+    const WIN_COOL = new THREE.Color(0xaad4ff);
+    // An unlit window: 25% of 0x110a00 over the building face, pre-blended so
+    // every window can share one material.
+    const WIN_DARK = new THREE.Color(0x0c1119);
+    const BEACON_ON  = new THREE.Color(0xff2222);
+    const BEACON_OFF = new THREE.Color(0x440000);
+
+    const tall = BLDGS.filter(([, bh]) => bh > 10);
+    const winSpots = [];  // [x, y, z] of every window
     BLDGS.forEach(([bx, bh, bw, bd]) => {
-      const geo = new THREE.BoxGeometry(bw, bh, bd);
-      const mat = new THREE.MeshPhongMaterial({ color: 0x0b1726, emissive: 0x040d1a, shininess: 40 });
-      const mesh = new THREE.Mesh(geo, mat);
-      mesh.position.set(bx, bh / 2 - 4, -5);
-      scene.add(mesh);
-
-      // Antenna on tall buildings
-      if (bh > 10) {
-        const antGeo = new THREE.CylinderGeometry(0.03, 0.03, bh * 0.25, 4);
-        const antMat = new THREE.MeshBasicMaterial({ color: 0x334455 });
-        const ant    = new THREE.Mesh(antGeo, antMat);
-        ant.position.set(bx, bh + (bh * 0.125) - 4, -5);
-        scene.add(ant);
-
-        // Blinking red beacon
-        const bGeo = new THREE.SphereGeometry(0.07, 6, 6);
-        const bMat = new THREE.MeshBasicMaterial({ color: 0xff2222 });
-        const beacon = new THREE.Mesh(bGeo, bMat);
-        beacon.position.set(bx, bh + (bh * 0.25) - 4, -5);
-        beacon.userData.beacon = true;
-        beacon.userData.phase  = Math.random() * Math.PI * 2;
-        scene.add(beacon);
-        windows.push(beacon);
-      }
-
-      // Windows
       const rows = Math.max(2, Math.floor(bh * 1.6));
       const cols = Math.max(1, Math.floor(bw * 2.2));
       for (let r = 0; r < rows; r++) {
         for (let c = 0; c < cols; c++) {
           if (Math.random() > 0.52) continue;
-          const lit = Math.random() > 0.25;
-          const wGeo = new THREE.PlaneGeometry(0.09, 0.13);
-          const wMat = new THREE.MeshBasicMaterial({
-            color: lit ? (Math.random() > 0.3 ? 0xffaa44 : 0xaad4ff) : 0x110a00,
-            transparent: true, opacity: lit ? 0.92 : 0.25,
-          });
-          const wm = new THREE.Mesh(wGeo, wMat);
           const wx = ((c + 0.5) / cols - 0.5) * bw * 0.78;
           const wy = ((r + 0.5) / rows - 0.5) * bh * 0.88;
-          wm.position.set(bx + wx, wy + bh / 2 - 4, -5 + bd / 2 + 0.025);
-          wm.userData = { lit, blinkPhase: Math.random() * Math.PI * 2, blinkRate: 1 + Math.random() * 4 };
-          scene.add(wm);
-          windows.push(wm);
+          winSpots.push([bx + wx, wy + bh / 2 - 4, -5 + bd / 2 + 0.025]);
         }
       }
     });
 
+    const m4  = new THREE.Matrix4();
+    const pos = new THREE.Vector3();
+    const scl = new THREE.Vector3();
+    const rot = new THREE.Quaternion();
+
+    const bldgMesh = new THREE.InstancedMesh(
+      new THREE.BoxGeometry(1, 1, 1),
+      new THREE.MeshPhongMaterial({ color: 0x0b1726, emissive: 0x040d1a, shininess: 40 }),
+      BLDGS.length,
+    );
+    BLDGS.forEach(([bx, bh, bw, bd], i) => {
+      bldgMesh.setMatrixAt(i, m4.compose(pos.set(bx, bh / 2 - 4, -5), rot, scl.set(bw, bh, bd)));
+    });
+    scene.add(bldgMesh);
+
+    // Antennas and blinking red beacons on the tall buildings
+    const antMesh = new THREE.InstancedMesh(
+      new THREE.CylinderGeometry(0.03, 0.03, 1, 4),
+      new THREE.MeshBasicMaterial({ color: 0x334455 }),
+      tall.length,
+    );
+    const beaconMesh = new THREE.InstancedMesh(
+      new THREE.SphereGeometry(0.07, 6, 6),
+      new THREE.MeshBasicMaterial({ color: 0xffffff }),
+      tall.length,
+    );
+    const beaconPhase = tall.map(() => Math.random() * Math.PI * 2);
+    tall.forEach(([bx, bh], i) => {
+      antMesh.setMatrixAt(i, m4.compose(pos.set(bx, bh + bh * 0.125 - 4, -5), rot, scl.set(1, bh * 0.25, 1)));
+      beaconMesh.setMatrixAt(i, m4.makeTranslation(bx, bh + bh * 0.25 - 4, -5));
+      beaconMesh.setColorAt(i, BEACON_ON);
+    });
+    scene.add(antMesh, beaconMesh);
+
+    const WIN_N   = winSpots.length;
+    const winLit  = new Uint8Array(WIN_N);
+    const winMesh = new THREE.InstancedMesh(
+      new THREE.PlaneGeometry(0.09, 0.13),
+      new THREE.MeshBasicMaterial({ color: 0xffffff, transparent: true, opacity: 0.92 }),
+      WIN_N,
+    );
+    function setWindow(i, lit) {
+      winLit[i] = lit ? 1 : 0;
+      winMesh.setColorAt(i, lit ? (Math.random() > 0.3 ? WIN_WARM : WIN_COOL) : WIN_DARK);
+    }
+    winSpots.forEach(([x, y, z], i) => {
+      winMesh.setMatrixAt(i, m4.makeTranslation(x, y, z));
+      setWindow(i, Math.random() > 0.25);
+    });
+    scene.add(winMesh);
+
+    // The old per-window loop flipped ~4% of windows every 45 frames; keep
+    // that rate, spread over frames with a fixed cap on writes per frame.
+    const FLICKER_RATE      = WIN_N * 0.04 / 45;
+    const FLICKER_PER_FRAME = Math.max(1, Math.ceil(FLICKER_RATE));
+    const FLICKER_CHANCE    = FLICKER_RATE / FLICKER_PER_FRAME;
+
     // ── FIRE / EMBER PARTICLES ───────────────────────────────────────────────────
     const FIRE_N = 3200;
     const fPos   = new Float32Array(FIRE_N * 3);
@@ -761,21 +882,22 @@ SITE_HTML = """<!DOCTYPE html>
         + (Math.random() - 0.5) * 0.3;
       fireLight.color.setHSL(0.065 + Math.sin(time * 4) * 0.012, 1.0, 0.5);
 
-      // Window & beacon blinking (every 45 frames)
+      // Window flicker: a bounded number of instance color writes per frame
+      let flickered = false;
+      for (let k = 0; k < FLICKER_PER_FRAME && WIN_N; k++) {
+        if (Math.random() >= FLICKER_CHANCE) continue;
+        const i = (Math.random() * WIN_N) | 0;
+        setWindow(i, !winLit[i]);
+        flickered = true;
+      }
+      if (flickered) winMesh.instanceColor.needsUpdate = true;
+
+      // Beacons (every 45 frames)
       if (frame % 45 === 0) {
-        windows.forEach(w => {
-          if (w.userData.beacon) {
-            const on = Math.sin(time * 1.8 + w.userData.phase) > 0;
-            w.material.color.setHex(on ? 0xff2222 : 0x440000);
-            return;
-          }
-          if (Math.random() < 0.04) {
-            w.userData.lit = !w.userData.lit;
-            const warmOrCool = Math.random() > 0.3;
-            w.material.color.setHex(w.userData.lit ? (warmOrCool ? 0xffaa44 : 0xaad4ff) : 0x110a00);
-            w.material.opacity = w.userData.lit ? 0.92 : 0.25;
-          }
-        });
+        for (let i = 0; i < tall.length; i++) {
+          beaconMesh.setColorAt(i, Math.sin(time * 1.8 + beaconPhase[i]) > 0 ? BEACON_ON : BEACON_OFF);
+        }
+        beaconMesh.instanceColor.needsUpdate = true;
       }
 
       // Haze pulse (Ravens purple)
@@ -805,27 +927,893 @@ SITE_HTML = """<!DOCTYPE html>
 """
 
 
+@dataclass(frozen=True)
+class RenderedPage:
+    """A rendered page held as ready-to-send bytes plus its validators."""
+
+    key: tuple
+    body: bytes
+    etag: str
+    last_modified: datetime
+    encodings: dict  # content-coding -> pre-compressed body
+    mimetype: str = "text/html"
+
+
+def make_rendered(key, body: bytes, mimetype="text/html") -> RenderedPage:
+    return RenderedPage(
+        key=key,
+        body=body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+        encodings=compress_variants(body),
+        mimetype=mimetype,
+    )
+
+
+# Preferred first; only codings whose variant was actually built are offered.
+ENCODING_PREFERENCE = ("br", "gzip")
+_ETAG_SUFFIX = {"br": "-br", "gzip": "-gz"}
+
+
+def compress_variants(body: bytes) -> dict:
+    """Build every compressed variant of ``body`` once, at maximum effort.
+
+    Variants that come out no smaller than the original are dropped.
+    """
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {k: v for k, v in variants.items() if len(v) < len(body)}
+
+
+def negotiate_encoding(encodings: dict):
+    """Pick the best pre-built coding for the current request, or None."""
+    accept = request.accept_encodings
+    best, best_q = None, 0
+    for coding in ENCODING_PREFERENCE:
+        if coding in encodings:
+            q = accept[coding]
+            if q > best_q:
+                best, best_q = coding, q
+    return best
+
+
+class PageCache:
+    """One rendered page per agent, re-rendered only when its inputs change.
+
+    ``inputs(agent)`` returns ``(key, state)``: a tuple that identifies
+    everything that agent's page depends on, its config version included,
+    so editing one agent's file re-renders only that agent, and whatever
+    ``render(agent, state)`` needs to build the page as a string, so a miss
+    doesn't gather its inputs twice. The check on the hot path is a single
+    tuple comparison, and concurrent misses for the same agent render once.
+
+    Pages live in an LRU bounded by ``max_bytes`` (body plus compressed
+    variants), so memory stays flat however many agents are configured.
+    """
+
+    def __init__(self, render, inputs, max_bytes):
+        self._render = render
+        self._inputs = inputs
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pages = OrderedDict()  # agent slug -> RenderedPage, LRU
+        self._lock = threading.Lock()
+        self._render_locks = {}      # agent slug -> Lock
+
+    def get(self, agent) -> RenderedPage:
+        key, state = self._inputs(agent)
+        page = self._pages.get(agent.slug)
+        if page is not None and page.key == key:
+            try:
+                self._pages.move_to_end(agent.slug)
+            except KeyError:
+                pass  # evicted meanwhile; still fine to serve
+            return page
+        with self._lock:
+            render_lock = self._render_locks.setdefault(agent.slug, threading.Lock())
+        with render_lock:
+            page = self._pages.get(agent.slug)
+            if page is None or page.key != key:
+                page = self._build(agent, key, state)
+                self._store(agent.slug, page)
+        return page
+
+    def invalidate(self, slug=None):
+        with self._lock:
+            for slug in [slug] if slug else list(self._pages):
+                page = self._pages.pop(slug, None)
+                if page is not None:
+                    self.bytes -= _page_bytes(page)
+
+    def _build(self, agent, key, state) -> RenderedPage:
+        return make_rendered(key, self._render(agent, state).encode("utf-8"))
+
+    def _store(self, slug, page):
+        with self._lock:
+            old = self._pages.pop(slug, None)
+            if old is not None:
+                self.bytes -= _page_bytes(old)
+            self._pages[slug] = page
+            self.bytes += _page_bytes(page)
+            # Always keep the page just rendered, even if it alone is too big.
+            while self.bytes > self.max_bytes and len(self._pages) > 1:
+                _, evicted = self._pages.popitem(last=False)
+                self.bytes -= _page_bytes(evicted)
+
+
+def _page_bytes(page: RenderedPage) -> int:
+    return len(page.body) + sum(len(v) for v in page.encodings.values())
+
+
+# ── Asset extraction ─────────────────────────────────────────────────────────
+# Inline <style> blocks and <script data-asset="name"> blocks are pulled out of
+# the rendered page into content-hashed files under /static/, so repeat
+# visitors only re-download the HTML shell.
+
+_STYLE_RE = re.compile(r"<style>(.*?)</style>", re.S)
+_SCRIPT_RE = re.compile(r'<script data-asset="([\w-]+)">(.*?)</script>', re.S)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+
+# Fingerprinted name -> RenderedPage. Earlier versions stay resolvable so
+# pages already sitting in browser caches keep working after a re-render.
+assets = {}
+
+
+def minify_css(css: str) -> str:
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = _CSS_PUNCT_RE.sub(r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js: str) -> str:
+    """Whitespace-only minification: indentation, blank and comment lines.
+
+    A light scan tracks strings, comments and template literals (with their
+    ``${}`` expressions), so text inside a multi-line template literal comes
+    through byte for byte. Anything that would need a real JS parser
+    (renaming, trailing comments, regex literals containing quotes) is left
+    alone.
+    """
+    out = []
+    stack = []  # "`" template, "{" expression brace inside one, "*" block comment
+    for line in js.splitlines():
+        starts_in_template = bool(stack) and stack[-1] == "`"
+        _scan_js_line(line, stack)
+        ends_in_template = bool(stack) and stack[-1] == "`"
+        if not starts_in_template:
+            line = line.lstrip()
+        if not ends_in_template:
+            line = line.rstrip()
+        if starts_in_template or ends_in_template or (line and not line.startswith("//")):
+            out.append(line)
+    return "\n".join(out)
+
+
+def _scan_js_line(line: str, stack: list):
+    """Advance the string/template/comment ``stack`` over one line of JS."""
+    i, n = 0, len(line)
+    while i < n:
+        c, top = line[i], stack[-1] if stack else None
+        if top == "*":
+            end = line.find("*/", i)
+            if end < 0:
+                return
+            stack.pop()
+            i = end + 2
+            continue
+        if top == "`":
+            if c == "\\":
+                i += 2
+                continue
+            if c == "`":
+                stack.pop()
+            elif line.startswith("${", i):
+                stack.append("{")
+                i += 1
+            i += 1
+            continue
+        if line.startswith("//", i):
+            return
+        if line.startswith("/*", i):
+            stack.append("*")
+            i += 2
+            continue
+        if c in "'\"":
+            i += 1
+            while i < n and line[i] != c:
+                i += 2 if line[i] == "\\" else 1
+        elif c == "`":
+            stack.append("`")
+        elif c == "{" and stack:
+            stack.append("{")
+        elif c == "}" and top == "{":
+            stack.pop()
+        i += 1
+
+
+def _add_asset(stem: str, ext: str, text: str, mimetype: str) -> str:
+    body = text.encode("utf-8")
+    name = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}.{ext}"
+    if name not in assets:
+        assets[name] = make_rendered((name,), body, mimetype)
+    return f"/static/{name}"
+
+
+def extract_assets(html: str) -> str:
+    """Move inline CSS/JS into fingerprinted assets; return the HTML shell."""
+    css = minify_css("\n".join(_STYLE_RE.findall(html)))
+    if css:
+        href = _add_asset("site", "css", css, "text/css")
+        link = f'<link rel="stylesheet" href="{href}">'
+        html = _STYLE_RE.sub("", _STYLE_RE.sub(link, html, count=1))
+
+    def script(m):
+        src = _add_asset(m.group(1), "js", minify_js(m.group(2)), "text/javascript")
+        return f'<script src="{src}"></script>'
+
+    return _SCRIPT_RE.sub(script, html)
+
+
+# ── Server-rendered fragments ────────────────────────────────────────────────
+
+LISTING_CARDS_HTML = """\
+{%- macro photo(l) %}
+{%- set img = l.img_url|local_image %}
+{%- if img -%}
+<picture><source type="image/webp" srcset="{{ images.srcset(img, 'webp') }}" sizes="{{ card_sizes }}"><img src="{{ images.url(img, images.bucket(img, 480), 'jpg') }}" srcset="{{ images.srcset(img, 'jpg') }}" sizes="{{ card_sizes }}" width="{{ img.width }}" height="{{ img.height }}" alt="{{ l.address }}" loading="lazy" decoding="async"></picture>
+{%- elif l.img_url -%}
+<img src="{{ l.img_url }}" alt="{{ l.address }}" loading="lazy">
+{%- else -%}
+<i class="bi bi-house-fill"></i>
+{%- endif %}
+{%- endmacro %}
+{%- for l in active %}
+      <div class="listing-card"><div class="listing-img">{{ photo(l) }}<span class="listing-badge">{{ "For Sale" if l.status == "active" else "Under Contract" }}</span></div><div class="listing-body"><div class="listing-price">{{ l.price|money }}</div><div class="listing-address">{{ l.address }}{% if l.city %} — {{ l.city }}{% endif %}</div><div class="listing-details">{% if l.beds %}<div class="listing-detail"><i class="bi bi-door-closed"></i> {{ l.beds|trim_float }} Beds</div>{% endif %}{% if l.baths %}<div class="listing-detail"><i class="bi bi-droplet"></i> {{ l.baths|trim_float }} Baths</div>{% endif %}{% if l.sqft %}<div class="listing-detail"><i class="bi bi-grid"></i> {{ "{:,}".format(l.sqft) }} sqft</div>{% endif %}</div></div></div>
+{%- endfor %}
+{%- for l in sold %}
+      <div class="listing-card"><div class="listing-img">{{ photo(l) }}<span class="listing-badge" style="background:#10b981">Sold</span></div><div class="listing-body"><div class="listing-price">{{ l.price|money }}</div><div class="listing-address">{{ l.address }}{% if l.city %} — {{ l.city }}{% endif %}</div><div class="listing-details">{% if l.sold_date %}<div class="listing-detail"><i class="bi bi-calendar-check"></i> Sold {{ l.sold_date }}</div>{% endif %}{% if l.list_price and l.list_price != l.price %}<div class="listing-detail"><i class="bi bi-tag"></i> Listed {{ l.list_price|money }}</div>{% endif %}{% if l.days_on_market %}<div class="listing-detail"><i class="bi bi-clock"></i> {{ l.days_on_market }} Days</div>{% endif %}<div class="listing-detail"><i class="bi bi-geo-alt"></i> {{ l.neighborhood or l.county }}</div></div></div></div>
+{%- endfor %}"""
+
+HERO_STATS_HTML = """\
+<div class="stat-item"><div class="stat-num">{{ overall.count }}</div><div class="stat-label">Homes Sold</div></div>
+      <div class="stat-item"><div class="stat-num">{{ overall.volume|short_money }}</div><div class="stat-label">Sales Volume</div></div>"""
+
+# How many of the most recent sales to feature next to the active listings.
+FEATURED_SOLD = 6
+
+app.jinja_env.filters["money"] = lambda n: f"${n:,}"
+app.jinja_env.filters["trim_float"] = lambda x: f"{x:g}"
+app.jinja_env.filters["short_money"] = short_money
+app.jinja_env.filters["local_image"] = lambda url: _local_image(url)
+app.jinja_env.globals["images"] = images
+# Listing cards span the page in one, two or three columns.
+app.jinja_env.globals["card_sizes"] = "(max-width: 700px) 90vw, (max-width: 1024px) 45vw, 30vw"
+
+
+def _local_image(url: str):
+    """The public/ image behind a site-relative ``imgUrl``, if we can resize it."""
+    if not images.enabled or not url.startswith("/") or url.startswith("//"):
+        return None
+    return images.source(url)
+
+
+@dataclass(frozen=True)
+class Fragment:
+    version: str  # version of the source data the fragment was rendered from
+    html: Markup
+    digest: str   # hash of the rendered HTML itself
+
+
+class FragmentCache:
+    """Holds one rendered HTML fragment until its source data version changes.
+
+    Pages key on ``Fragment.digest`` rather than the data version, so data
+    edits that don't change the rendered markup don't invalidate the page.
+    """
+
+    def __init__(self, render):
+        self._render = render
+        self._fragment = None
+
+    def get(self, version, *args) -> Fragment:
+        frag = self._fragment
+        if frag is None or frag.version != version:
+            html = self._render(*args)
+            frag = Fragment(version, Markup(html), hashlib.sha256(html.encode()).hexdigest()[:16])
+            self._fragment = frag
+        return frag
+
+
+_listing_cards_template = app.jinja_env.from_string(LISTING_CARDS_HTML)
+
+
+def _featured_listings(snap):
+    """The listings that get a card: every active one and the latest sales."""
+    return (
+        snap.query(status="active", sort="-price"),
+        snap.query(status="sold", sort="-date", limit=FEATURED_SOLD),
+    )
+
+
+def _render_listing_cards(snap):
+    active, sold = _featured_listings(snap)
+    return _listing_cards_template.render(active=active, sold=sold).strip()
+
+
+_hero_stats_template = app.jinja_env.from_string(HERO_STATS_HTML)
+
+
+def _render_hero_stats(stats):
+    return _hero_stats_template.render(overall=stats["overall"])
+
+
+# Seconds between re-checks of the card photos' mtimes.
+PHOTO_CHECK_INTERVAL = float(os.environ.get("SITE_PHOTO_CHECK_INTERVAL", 5.0))
+
+
+class CardsVersion:
+    """Version of the listing cards: the snapshot etag plus the version of
+    every card photo, since srcsets carry it and a replaced photo must
+    re-render.
+
+    The photo set is collected once per snapshot, and their files are
+    re-stat'ed at most every ``PHOTO_CHECK_INTERVAL`` seconds by one thread
+    while the others keep the previous answer.
+    """
+
+    def __init__(self):
+        self._snap = None
+        self._photos = ()   # image URLs of the rendered cards
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, snap) -> str:
+        if (snap is self._snap and self._version is not None
+                and time.monotonic() - self._checked < PHOTO_CHECK_INTERVAL):
+            return self._version
+        if not self._lock.acquire(blocking=self._version is None or snap is not self._snap):
+            return self._version
+        try:
+            if (snap is self._snap and self._version is not None
+                    and time.monotonic() - self._checked < PHOTO_CHECK_INTERVAL):
+                return self._version  # another thread just refreshed it
+            if snap is not self._snap:
+                self._photos = tuple(
+                    l.img_url for group in _featured_listings(snap) for l in group if l.img_url
+                )
+            photos = (_local_image(url) for url in self._photos)
+            self._version = ":".join([snap.etag, *(p.version for p in photos if p)])
+            self._snap, self._checked = snap, time.monotonic()
+            return self._version
+        finally:
+            self._lock.release()
+
+
+class ListingData:
+    """A listings file and everything derived from it: the search indexes,
+    stats and rendered fragments. Agents that show the same file share one."""
+
+    def __init__(self, path: str):
+        self.index = ListingIndex(path)
+        self.suggest = SuggestIndex()
+        self.stats = StatsCache()
+        self.comps = CompCache()
+        self.cards = FragmentCache(_render_listing_cards)
+        self.cards_version = CardsVersion()
+        self.hero_stats = FragmentCache(_render_hero_stats)
+
+
+_listing_data = {}  # listings path -> ListingData
+_listing_data_lock = threading.Lock()
+
+
+def listing_data(agent) -> ListingData:
+    data = _listing_data.get(agent.listings_path)
+    if data is None:
+        with _listing_data_lock:
+            data = _listing_data.get(agent.listings_path)
+            if data is None:
+                data = _listing_data[agent.listings_path] = ListingData(agent.listings_path)
+    return data
+
+
+def _site_fragments(agent):
+    data = listing_data(agent)
+    snap = data.index.snapshot()
+    return {
+        "listings_html": data.cards.get(data.cards_version.get(snap), snap),
+        "hero_stats_html": data.hero_stats.get(snap.etag, data.stats.get(snap)),
+    }
+
+
+_site_template = app.jinja_env.from_string(SITE_HTML)
+
+
+def _render_site(agent, fragments):
+    html = _site_template.render(agent=agent, **{k: f.html for k, f in fragments.items()})
+    return extract_assets(html)
+
+
+def _site_inputs(agent):
+    fragments = _site_fragments(agent)
+    return (SITE_HTML, agent.version, *(f.digest for f in fragments.values())), fragments
+
+
+site_page = PageCache(
+    render=_render_site,
+    inputs=_site_inputs,
+    max_bytes=int(os.environ.get("SITE_PAGE_CACHE_BYTES", 32 * 1024 * 1024)),
+)
+metrics.gauge("page_cache_bytes", "Rendered agent pages held in memory, in bytes.", lambda: site_page.bytes)
+
+# Revalidate on every view (cheap with 304s) vs. cache forever by file name.
+HTML_CACHE_CONTROL = "no-cache"
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# public/ file names aren't fingerprinted: cache briefly, then revalidate.
+PUBLIC_CACHE_CONTROL = "public, max-age=3600"
+
+public_files = PublicFiles(os.path.join(HERE, "public"), PUBLIC_CACHE_CONTROL)
+
+
+def send_page(page: RenderedPage, cache_control=HTML_CACHE_CONTROL) -> Response:
+    """Serve a cached page, answering conditional requests with 304.
+
+    The body is the best pre-compressed variant the client accepts; each
+    variant carries its own strong ETag.
+    """
+    coding = negotiate_encoding(page.encodings)
+    if coding is None:
+        resp = Response(page.body, mimetype=page.mimetype)
+        resp.set_etag(page.etag)
+    else:
+        resp = Response(page.encodings[coding], mimetype=page.mimetype)
+        resp.content_encoding = coding
+        resp.set_etag(page.etag + _ETAG_SUFFIX[coding])
+    resp.vary.add("Accept-Encoding")
+    resp.last_modified = page.last_modified
+    resp.headers["Cache-Control"] = cache_control
+    return resp.make_conditional(request)
+
+
+def request_agent():
+    """The agent whose site this request's Host header names."""
+    return agents.for_host(request.host)
+
+
 @app.route("/")
 def index():
-    return render_template_string(SITE_HTML)
+    return send_page(site_page.get(request_agent()))
+
+
+@app.route("/static/<name>")
+def static_asset(name):
+    asset = assets.get(name)
+    if asset is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    return send_page(asset, ASSET_CACHE_CONTROL)
+
+
+@app.route("/<path:name>")
+def public_file(name):
+    """Anything else under public/: logos, robots.txt, sitemap.xml..."""
+    version = public_files.lookup(name)
+    if version is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    return public_files.response(version, request)
+
+
+@app.route("/img/<path:name>")
+def resized_image(name):
+    """A public/ image at ``w`` (snapped to a width bucket) as ``fm`` webp or jpg."""
+    fmt = request.args.get("fm", "jpg")
+    src = images.source(name) if images.enabled else None
+    if src is None or fmt not in FORMATS:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    width = images.bucket(src, request.args.get("w", src.width, type=int))
+    resp = send_file(images.variant(src, width, fmt), mimetype=FORMATS[fmt], conditional=True)
+    # Versioned srcset URLs never change; anything else revalidates.
+    resp.headers["Cache-Control"] = (
+        ASSET_CACHE_CONTROL if request.args.get("v") == src.version else HTML_CACHE_CONTROL
+    )
+    return resp
+
+
+@app.route("/contact", methods=["GET"])
+def contact_wrong_method():
+    """GET/HEAD /contact would otherwise fall through to public_file and 404."""
+    resp = jsonify({"ok": False, "error": "method not allowed"})
+    resp.status_code = 405
+    resp.headers["Allow"] = "POST"
+    return resp
 
 
 @app.route("/contact", methods=["POST"])
 def contact():
-    from datetime import datetime
+    wait = contact_limiter.acquire(request.remote_addr) if contact_limiter else 0
+    if wait:
+        resp = jsonify({"ok": False, "error": "too many requests"})
+        resp.headers["Retry-After"] = str(math.ceil(wait))
+        return resp, 429
+    agent = request_agent()
     data = request.get_json(silent=True) or {}
-    print(
-        f"\n[{datetime.now():%Y-%m-%d %H:%M}] NEW CONTACT INQUIRY\n"
-        f"  Name:     {data.get('first_name', '')} {data.get('last_name', '')}\n"
-        f"  Email:    {data.get('email', '')}\n"
-        f"  Phone:    {data.get('phone', '')}\n"
-        f"  Interest: {data.get('interest', '')}\n"
-        f"  Message:  {data.get('message', '')}\n"
+    lead = clean_lead(data)
+    lead["agent"] = agent.slug
+    fingerprint = DedupFilter.fingerprint(
+        agent.slug,
+        email_key(lead["email"]),
+        phone_key(lead["phone"]),
+        " ".join(lead["message"].lower().split()),
     )
+    if contact_dedup.is_duplicate(fingerprint):
+        return jsonify({"ok": True})
+    lead_store.submit(lead)
+    notifier.notify({**lead, **agent.notify_fields()})
+    log.info("contact inquiry", extra={"lead": lead})
     return jsonify({"ok": True})
 
 
-if __name__ == "__main__":
-    port = int(os.environ.get("SITE_PORT", 5002))
+@app.route("/api/listings")
+def api_listings():
+    """Active and sold listings from listings.json, filtered and sorted.
+
+    Query: status, county, neighborhood, min_price, max_price,
+    sort (price, -price, date, -date), limit.
+    """
+    args = request.args
+    status = args.get("status") or None
+    if status and status not in STATUSES:
+        return jsonify({"ok": False, "error": f"status must be one of {', '.join(STATUSES)}"}), 400
+    snap = listing_data(request_agent()).index.snapshot()
+    key = tuple(sorted(args.items(multi=True)))
+
+    def build():
+        listings = snap.query(
+            status=status,
+            county=args.get("county"),
+            neighborhood=args.get("neighborhood"),
+            min_price=args.get("min_price", type=int),
+            max_price=args.get("max_price", type=int),
+            sort=args.get("sort", "-date"),
+            limit=args.get("limit", type=int),
+        )
+        return json.dumps({"ok": True, "listings": [l.to_json() for l in listings]}).encode()
+
+    try:
+        body = snap.cached_response(key, build)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(f"{snap.etag}-{hashlib.sha256(repr(key).encode()).hexdigest()[:8]}")
+    resp.headers["Cache-Control"] = HTML_CACHE_CONTROL
+    return resp.make_conditional(request)
+
+
+@app.route("/api/stats")
+def api_stats():
+    """Market statistics for sold listings: overall, by county and by month."""
+    data = listing_data(request_agent())
+    snap = data.index.snapshot()
+    body = snap.cached_response(
+        ("stats",), lambda: json.dumps({"ok": True, **data.stats.get(snap)}).encode()
+    )
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(f"{snap.etag}-stats")
+    resp.headers["Cache-Control"] = HTML_CACHE_CONTROL
+    return resp.make_conditional(request)
+
+
+@app.route("/api/listings/suggest")
+def api_listings_suggest():
+    """Typeahead over address, city/ZIP, neighborhood and county.
+
+    Query: q, min_price, max_price, limit (max 20).
+    """
+    args = request.args
+    data = listing_data(request_agent())
+    data.suggest.sync(data.index.snapshot())
+    matches = data.suggest.search(
+        args.get("q", ""),
+        min_price=args.get("min_price", type=int),
+        max_price=args.get("max_price", type=int),
+        limit=max(1, min(args.get("limit", 8, type=int), 20)),
+    )
+    return jsonify({"ok": True, "suggestions": [l.to_json() for l in matches]})
+
+
+def _subject_number(args, name, kind, allow_zero):
+    """An optional numeric query parameter, or None when absent.
+
+    Raises ValueError when it isn't a finite number, is negative, or is 0
+    where that makes no sense (a 0 sqft subject would wreck price per sqft).
+    """
+    raw = args.get(name, "").strip()
+    if not raw:
+        return None
+    try:
+        value = kind(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+    if not math.isfinite(value) or value < 0 or (value == 0 and not allow_zero):
+        raise ValueError(f"{name} must be {'at least 0' if allow_zero else 'greater than 0'}")
+    return value or None
+
+
+@app.route("/api/cma")
+def api_cma():
+    """Comparable sales and a price estimate for a subject property.
+
+    Query: zip, or address (with a ZIP code), or lat and lng; optional
+    sqft, beds, baths; k (comps returned, max 20).
+    """
+    args = request.args
+    address = args.get("address", "")
+    try:
+        lat, lng, zip_code = resolve_subject(
+            args.get("zip", ""), address, args.get("lat", type=float), args.get("lng", type=float),
+        )
+        subject = {
+            "zip": zip_code or None,
+            "lat": lat,
+            "lng": lng,
+            "sqft": _subject_number(args, "sqft", int, allow_zero=False),
+            "beds": _subject_number(args, "beds", float, allow_zero=True),
+            "baths": _subject_number(args, "baths", float, allow_zero=True),
+        }
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    data = listing_data(request_agent())
+    result = data.comps.get(data.index.snapshot()).estimate(
+        lat, lng,
+        sqft=subject["sqft"], beds=subject["beds"], baths=subject["baths"],
+        k=args.get("k", 5, type=int),
+        # The subject's own past sale is not a comp for itself.
+        exclude_address=address.split(",")[0],
+    )
+    if result is None:
+        return jsonify({"ok": False, "error": f"no comparable sales within {MAX_RADIUS_KM:g} km"}), 404
+    return jsonify({
+        "ok": True,
+        "subject": subject,
+        "estimate": round(result.estimate),
+        "low": round(result.low),
+        "high": round(result.high),
+        "comps": [
+            {
+                **c.listing.to_json(),
+                "distanceKm": round(c.distance_km, 2),
+                "score": round(c.score, 3),
+                "adjustedPrice": round(c.adjusted_price),
+            }
+            for c in result.comps
+        ],
+    })
+
+
+def _leads_authorized() -> bool:
+    token = os.environ.get("LEADS_API_TOKEN", "")
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@app.route("/leads")
+def leads():
+    """Filtered, cursor-paginated lead listing for the back office.
+
+    Requires ``Authorization: Bearer $LEADS_API_TOKEN``; disabled when the
+    token is not configured.
+    """
+    if not _leads_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    args = request.args
+    interest = args.get("interest", "").lower() or None
+    if interest and interest not in INTEREST_CODES:
+        return jsonify({"ok": False, "error": f"interest must be one of {', '.join(INTEREST_CODES)}"}), 400
+    try:
+        rows, next_cursor = query_leads(
+            lead_store.reader(),
+            since=parse_time(args["since"]) if args.get("since") else None,
+            until=parse_time(args["until"]) if args.get("until") else None,
+            interest=interest,
+            agent=args.get("agent"),
+            person=args.get("person", type=int),
+            email=args.get("email"),
+            phone=args.get("phone"),
+            cursor=args.get("cursor"),
+            limit=args.get("limit", 50, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": True, "leads": rows, "next": next_cursor})
+
+
+@app.route("/leads/export")
+def leads_export():
+    """Every matching lead as a CSV or NDJSON download, streamed.
+
+    Takes ``since``/``until``/``interest``/``agent``/``person`` like
+    ``/leads`` plus ``format`` (csv or ndjson) and ``gzip=1``. The body is
+    sent with chunked transfer encoding as rows are read, so a year of leads
+    costs the worker one page of rows, and only the thread serving the
+    download is busy.
+    """
+    if not _leads_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    args = request.args
+    fmt = args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"ok": False, "error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    interest = args.get("interest", "").lower() or None
+    if interest and interest not in INTEREST_CODES:
+        return jsonify({"ok": False, "error": f"interest must be one of {', '.join(INTEREST_CODES)}"}), 400
+    try:
+        filters = {
+            "since": parse_time(args["since"]) if args.get("since") else None,
+            "until": parse_time(args["until"]) if args.get("until") else None,
+            "interest": interest,
+            "agent": args.get("agent"),
+            "person": args.get("person", type=int),
+        }
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    compress = args.get("gzip", "") in ("1", "true", "yes")
+    filename = f"leads-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{fmt}" + (".gz" if compress else "")
+    resp = Response(
+        export_leads(lead_store.path, fmt, compress, **filters),
+        mimetype="application/gzip" if compress else
+        ("text/csv" if fmt == "csv" else "application/x-ndjson"),
+    )
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"  # stream through nginx too
+    return resp
+
+
+@app.route("/leads/people/<int:person_id>")
+def lead_person(person_id):
+    """One prospect as resolved across submissions, with their history."""
+    if not _leads_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    person = get_person(lead_store.reader(), person_id)
+    if person is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    return jsonify({"ok": True, "person": person})
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of the request and queue metrics."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Render the default agent's page at import so its first visitor never pays
+# for it; other agents render on their first request.
+site_page.get(agents.default())
+
+
+# ── Static export ────────────────────────────────────────────────────────────
+
+_ENCODING_EXT = {"gzip": ".gz", "br": ".br"}
+
+
+def _write_page(path: str, page: RenderedPage) -> dict:
+    """Write a page and its compressed siblings (``.gz``/``.br``)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(page.body)
+    files = {"identity": os.path.basename(path)}
+    for coding, body in page.encodings.items():
+        with open(path + _ENCODING_EXT[coding], "wb") as f:
+            f.write(body)
+        files[coding] = os.path.basename(path) + _ENCODING_EXT[coding]
+    return {
+        "etag": page.etag,
+        "content_type": page.mimetype,
+        "bytes": len(page.body),
+        "files": files,
+    }
+
+
+def export_site(dest: str, slug: str = None) -> dict:
+    """Prerender one agent's site (default: the default agent) into ``dest``
+    for a web server or CDN to serve.
+
+    The layout matches the URL space (``index.html``, ``static/<name>``) and
+    every file has pre-compressed siblings, so nginx can serve it with
+    ``gzip_static``/``brotli_static`` and proxy ``/contact``, ``/api/`` and
+    the resized ``/img/`` variants to Flask.
+    """
+    agent = agents.agents()[slug] if slug else agents.default()
+    page = site_page.get(agent)
+    manifest = {
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "agent": agent.slug,
+        "index": _write_page(os.path.join(dest, "index.html"), page),
+        "assets": {
+            name: _write_page(os.path.join(dest, "static", name), asset)
+            for name, asset in sorted(assets.items())
+        },
+        "cache_control": {"index": HTML_CACHE_CONTROL, "static": ASSET_CACHE_CONTROL},
+    }
+    with open(os.path.join(dest, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def run_dev(port: int):
     print(f"  * jungmarker.com site running at http://localhost:{port}")
     app.run(host="0.0.0.0", port=port, debug=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="jungmarker_site.py")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("dev", help="run Werkzeug's development server (default)")
+    serve = commands.add_parser("serve", help="run the pre-forking production server")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--workers", type=int, default=int(os.environ.get("SITE_WORKERS", 0)),
+                       help="worker processes (default: CPU count)")
+    serve.add_argument("--max-requests", type=int,
+                       default=int(os.environ.get("SITE_MAX_REQUESTS", 10000)),
+                       help="recycle a worker after this many requests (0: never)")
+    export = commands.add_parser("export", help="prerender the site to a directory")
+    export.add_argument("dest", help="output directory, e.g. dist/")
+    export.add_argument("--agent", help="agent slug to export (default: AGENT_DEFAULT)")
+    imp = commands.add_parser("import", help="merge an MLS/Zillow export into a listings file")
+    imp.add_argument("source", help="export file: .csv, .tsv, .ndjson or .jsonl, optionally .gz")
+    imp.add_argument("--agent", help="agent whose listings file to update (default: AGENT_DEFAULT)")
+    imp.add_argument("--dry-run", action="store_true", help="report the changes without writing")
+    lexp = commands.add_parser("export-leads", help="stream stored leads as CSV or NDJSON")
+    lexp.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    lexp.add_argument("--since", type=parse_time, help="ISO date or datetime, inclusive")
+    lexp.add_argument("--until", type=parse_time, help="ISO date or datetime, exclusive")
+    lexp.add_argument("--interest", choices=INTEREST_CODES)
+    # Not checked against the registry: leads outlive the agent configs.
+    lexp.add_argument("--agent", dest="lead_agent", help="only leads sent through this agent's site")
+    lexp.add_argument("--person", type=int, help="only this person's submissions")
+    lexp.add_argument("--gzip", action="store_true", help="gzip the output")
+    lexp.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+    port = int(os.environ.get("SITE_PORT", 5002))
+    # Not at import time: tests and other importers keep their own handlers.
+    # Each serve worker configures its own in jungmarker_serve.
+    configure_logging()
+
+    if getattr(args, "agent", None) and args.agent not in agents.agents():
+        parser.error(f"unknown agent {args.agent!r}; have {', '.join(sorted(agents.agents()))}")
+
+    if args.command == "export":
+        manifest = export_site(args.dest, args.agent)
+        print(f"  * exported index.html + {len(manifest['assets'])} assets to {args.dest}")
+    elif args.command == "import":
+        agent = agents.agents()[args.agent] if args.agent else agents.default()
+        try:
+            result = import_listings(args.source, agent.listings_path, dry_run=args.dry_run)
+        except (OSError, ValueError) as e:
+            parser.exit(1, f"import failed: {e}\n")
+        print(f"  * {result.rows} rows: {result.added} added, {result.updated} updated, "
+              f"{result.removed} removed, {result.unchanged} unchanged, {result.skipped} skipped")
+        if result.written:
+            print(f"  * wrote {agent.listings_path}")
+        elif result.changed:
+            print("  * dry run; nothing written")
+    elif args.command == "export-leads":
+        chunks = export_leads(
+            lead_store.path, args.format, args.gzip, since=args.since, until=args.until,
+            interest=args.interest, agent=args.lead_agent, person=args.person,
+        )
+        with open(args.output, "wb") if args.output else contextlib.nullcontext(sys.stdout.buffer) as out:
+            for chunk in chunks:
+                out.write(chunk)
+    elif args.command == "serve":
+        from jungmarker_serve import serve as serve_prefork
+        serve_prefork("jungmarker_site", args.host, port, args.workers, args.max_requests)
+    else:
+        run_dev(port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Market statistics over the sold listings in public/listings.json.
+
+Sale price, list price and days on market are loaded into NumPy columns and
+every aggregate (totals, medians, sale-to-list ratios, days-on-market
+percentiles) is computed for all groups at once with bincount and shared
+sorts, overall, per county and per month. ``StatsCache`` recomputes only
+when the listings snapshot changes.
+"""
+
+import threading
+
+import numpy as np
+
+DOM_PERCENTILES = (0.5, 0.75, 0.9)
+
+
+def group_quantiles(codes, values, ngroups, qs, order=None):
+    """Linear-interpolated quantiles of ``values`` within each group.
+
+    ``order`` may pass in a precomputed stable argsort of ``values`` so that
+    several groupings share one float sort; grouping on top of it is a
+    stable (radix) sort of small integer codes. Returns an
+    ``(ngroups, len(qs))`` array; empty groups are NaN.
+    """
+    qs = np.asarray(qs, dtype=float)
+    counts = np.bincount(codes, minlength=ngroups)
+    out = np.full((ngroups, len(qs)), np.nan)
+    if not len(values):
+        return out
+    if order is None:
+        order = np.argsort(values, kind="stable")
+    ordered = values[order[np.argsort(codes[order], kind="stable")]]
+    starts = np.cumsum(counts) - counts
+    pos = starts[:, None] + qs[None, :] * np.maximum(counts - 1, 0)[:, None]
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.ceil(pos).astype(np.intp)
+    frac = pos - lo
+    nonempty = counts > 0
+    lo, hi, frac = lo[nonempty], hi[nonempty], frac[nonempty]
+    out[nonempty] = ordered[lo] * (1 - frac) + ordered[hi] * frac
+    return out
+
+
+def factorize(values):
+    """Sorted distinct values and each element's index into them."""
+    index = {}
+    codes = np.array([index.setdefault(v, len(index)) for v in values], dtype=np.intp)
+    names = sorted(index)
+    remap = np.empty(len(names), dtype=np.intp)
+    remap[[index[n] for n in names]] = np.arange(len(names))
+    return names, remap[codes] if len(codes) else codes
+
+
+class _Columns:
+    """Sold-listing columns plus the value sorts every grouping reuses."""
+
+    def __init__(self, sold):
+        self.sale = np.array([l.price for l in sold], dtype=float)
+        self.listed = np.array([l.list_price for l in sold], dtype=float)
+        self.dom = np.array([l.days_on_market for l in sold], dtype=float)
+        self.priced = self.listed > 0
+        self.ratio = self.sale[self.priced] / self.listed[self.priced]
+        self.sale_order = np.argsort(self.sale, kind="stable")
+        self.dom_order = np.argsort(self.dom, kind="stable")
+        self.ratio_order = np.argsort(self.ratio, kind="stable")
+
+
+def _aggregate(codes, ngroups, c: _Columns):
+    count = np.bincount(codes, minlength=ngroups)
+    volume = np.bincount(codes, weights=c.sale, minlength=ngroups)
+    # Ratios only where a list price is known.
+    pcodes = codes[c.priced]
+    sale_priced = np.bincount(pcodes, weights=c.sale[c.priced], minlength=ngroups)
+    list_priced = np.bincount(pcodes, weights=c.listed[c.priced], minlength=ngroups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        aggregate_ratio = sale_priced / list_priced
+        average_price = volume / count
+    return {
+        "count": count,
+        "volume": volume,
+        "average_price": average_price,
+        "median_price": group_quantiles(codes, c.sale, ngroups, [0.5], c.sale_order)[:, 0],
+        "sale_to_list": aggregate_ratio,
+        "median_sale_to_list": group_quantiles(pcodes, c.ratio, ngroups, [0.5], c.ratio_order)[:, 0],
+        "days_on_market": group_quantiles(codes, c.dom, ngroups, DOM_PERCENTILES, c.dom_order),
+    }
+
+
+def _rows(names, agg):
+    def num(x, digits=None):
+        x = float(x)
+        if np.isnan(x):
+            return None
+        return round(x, digits) if digits is not None else x
+
+    rows = {}
+    for i, name in enumerate(names):
+        rows[name] = {
+            "count": int(agg["count"][i]),
+            "volume": num(agg["volume"][i], 0),
+            "average_price": num(agg["average_price"][i], 0),
+            "median_price": num(agg["median_price"][i], 0),
+            "sale_to_list": num(agg["sale_to_list"][i], 4),
+            "median_sale_to_list": num(agg["median_sale_to_list"][i], 4),
+            "days_on_market": {
+                f"p{int(q * 100)}": num(v, 1)
+                for q, v in zip(DOM_PERCENTILES, agg["days_on_market"][i])
+            },
+        }
+    return rows
+
+
+def compute_stats(listings) -> dict:
+    """Aggregate sold ``Listing`` records overall, by county and by month."""
+    sold = [l for l in listings if l.status == "sold"]
+    cols = _Columns(sold)
+    counties, county_codes = factorize(l.county or "Unknown" for l in sold)
+    # Undated sales get a trailing "" group that is dropped from the output.
+    months, month_codes = factorize(l.date[:7] for l in sold)
+    if months and months[0] == "":
+        month_codes = np.where(month_codes == 0, len(months) - 1, month_codes - 1)
+        months = months[1:] + [""]
+
+    by_month = _rows(months, _aggregate(month_codes, len(months), cols))
+    by_month.pop("", None)
+    return {
+        "overall": _rows(["all"], _aggregate(np.zeros(len(sold), dtype=np.intp), 1, cols))["all"],
+        "by_county": _rows(counties, _aggregate(county_codes, len(counties), cols)),
+        "by_month": by_month,
+    }
+
+
+class StatsCache:
+    """The stats of the current listings snapshot, computed once per version."""
+
+    def __init__(self):
+        self._version = None
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def get(self, snap) -> dict:
+        if self._version != snap.etag:
+            with self._lock:
+                if self._version != snap.etag:
+                    self._stats = compute_stats(snap.listings)
+                    self._version = snap.etag
+        return self._stats
+
+
+def short_money(amount: float) -> str:
+    """``48_200_000`` -> ``"$48.2M"``; ``950_000`` -> ``"$950K"``."""
+    for scale, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if amount >= scale:
+            return f"${amount / scale:.1f}".rstrip("0").rstrip(".") + suffix
+    return f"${amount:,.0f}"
@@ -0,0 +1,91 @@
+from jungmarker_identity import blocking_keys, email_key, phone_key
+from jungmarker_leads import LeadStore, clean_lead, connect, get_person
+
+
+def _resolve_all(tmp_path, *leads):
+    """Store ``leads`` in order; return each one's person id and the connection."""
+    store = LeadStore(str(tmp_path / "leads.db"), flush_interval=0.01)
+    for lead in leads:
+        store.submit(clean_lead(lead))
+    store.close()
+    conn = connect(store.path)
+    return [r[0] for r in conn.execute("SELECT person_id FROM leads ORDER BY id")], conn
+
+
+def test_normalisation():
+    assert email_key(" J.Smith+zillow@GoogleMail.com ") == "jsmith@gmail.com"
+    assert email_key("j.smith+x@work.com") == "j.smith@work.com"
+    assert phone_key("+1 (301) 555-0100 ext. 12") == "3015550100"
+    assert blocking_keys({"email": "info@agency.com", "last_name": "Ng", "message": "in 21201"}) == [
+        "e:info@agency.com", "n:ng|21201",
+    ]
+
+
+def test_same_phone_in_any_format_is_one_person(tmp_path):
+    ids, _ = _resolve_all(
+        tmp_path,
+        {"first_name": "Ann", "email": "ann@a.com", "phone": "(301) 555-0100"},
+        {"first_name": "Ann", "email": "other@b.com", "phone": "+1 301.555.0100"},
+    )
+    assert ids[0] == ids[1]
+
+
+def test_same_canonical_email_is_one_person(tmp_path):
+    ids, _ = _resolve_all(
+        tmp_path,
+        {"first_name": "Ann", "email": "ann.lee@gmail.com"},
+        {"first_name": "Annie", "email": "AnnLee+house@googlemail.com"},
+    )
+    assert ids[0] == ids[1]
+
+
+def test_email_local_part_needs_the_same_last_name(tmp_path):
+    ids, _ = _resolve_all(
+        tmp_path,
+        {"first_name": "Jo", "last_name": "Smith", "email": "jsmith@gmail.com"},
+        {"first_name": "Jo", "last_name": "Smith", "email": "jsmith@work.com"},
+        {"first_name": "Jay", "last_name": "Smythe", "email": "jsmith@school.edu"},
+    )
+    assert ids[0] == ids[1]
+    assert ids[2] != ids[0]
+
+
+def test_last_name_and_zip_need_a_compatible_first_name(tmp_path):
+    ids, _ = _resolve_all(
+        tmp_path,
+        {"first_name": "Jon", "last_name": "Park", "email": "a@a.com", "zip": "21201"},
+        {"first_name": "Jonathan", "last_name": "Park", "email": "b@b.com",
+         "message": "Selling in 21201-3344"},
+        {"first_name": "Jane", "last_name": "Park", "email": "c@c.com", "zip": "21201"},
+        {"first_name": "Jon", "last_name": "Park", "email": "d@d.com", "zip": "21230"},
+    )
+    assert ids[0] == ids[1]
+    assert len({ids[0], ids[2], ids[3]}) == 3
+
+
+def test_a_lead_matching_two_people_merges_them_into_the_oldest(tmp_path):
+    ids, conn = _resolve_all(
+        tmp_path,
+        {"first_name": "Ann", "email": "ann@a.com", "phone": "301-555-0100"},
+        {"first_name": "Ann", "email": "ann@b.com", "phone": "410-555-0199"},
+        {"first_name": "Ann", "email": "ann@b.com", "phone": "301-555-0100"},
+    )
+    assert ids == [ids[0]] * 3
+    assert conn.execute("SELECT COUNT(*) FROM people").fetchone()[0] == 1
+    person = get_person(conn, ids[0])
+    assert person["submissions"] == 3
+    assert len(person["history"]) == 3
+    keys = {r[0] for r in conn.execute("SELECT key FROM person_keys WHERE person_id = ?", (ids[0],))}
+    assert {"p:3015550100", "p:4105550199", "e:ann@a.com", "e:ann@b.com"} <= keys
+    assert conn.execute(
+        "SELECT COUNT(*) FROM person_keys WHERE person_id != ?", (ids[0],)
+    ).fetchone()[0] == 0
+
+
+def test_strangers_stay_apart(tmp_path):
+    ids, _ = _resolve_all(
+        tmp_path,
+        {"first_name": "Ann", "last_name": "Lee", "email": "info@x.com"},
+        {"first_name": "Bob", "last_name": "Kim", "email": "info@y.com"},
+    )
+    assert ids[0] != ids[1]
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from jungmarker_import import import_listings, write_atomic
+
+HEADER = "MLS #,Status,Address,City,State,Zip,List Price,Close Price,Close Date,Beds\n"
+
+
+def _listings(tmp_path, active=(), sold=()):
+    path = tmp_path / "listings.json"
+    path.write_text(json.dumps({"_readme": "hand-kept", "active": list(active), "sold": list(sold)}))
+    return path
+
+
+def _export(tmp_path, *rows):
+    path = tmp_path / "export.csv"
+    path.write_text(HEADER + "".join(row + "\n" for row in rows))
+    return path
+
+
+def test_merge_updates_moves_adds_and_drops(tmp_path):
+    dest = _listings(tmp_path, active=[
+        {"id": 1, "mlsId": "MD1", "address": "1 Oak St", "city": "Towson, MD 21204",
+         "price": 400000, "imgUrl": "/oak.jpg"},
+        {"id": 2, "mlsId": "MD2", "address": "2 Elm St", "city": "Towson, MD 21204", "price": 500000},
+        {"id": 3, "mlsId": "MD3", "address": "3 Ash St", "city": "Towson, MD 21204", "price": 300000},
+    ], sold=[
+        {"id": 4, "mlsId": "MD4", "address": "4 Fir St", "city": "Towson, MD 21204", "salePrice": 250000},
+    ])
+    source = _export(
+        tmp_path,
+        "MD1,Active,1 Oak St,Towson,MD,21204,\"$389,000\",,,3",  # price cut
+        "MD2,Closed,2 Elm St,Towson,MD,21204,500000,510000,2025-03-14,",  # sold
+        "MD3,Withdrawn,3 Ash St,Towson,MD,21204,,,,",  # off the market
+        "MD4,Active,4 Fir St,Towson,MD,21204,260000,,,",  # stale row for a closed MLS number
+        "MD5,Active,5 Elm St,Columbia,MD,21044,620000,,,4",  # new
+        ",Active,,Columbia,MD,21044,1,,,",  # no address: skipped
+    )
+
+    result = import_listings(str(source), str(dest))
+
+    assert (result.rows, result.added, result.updated, result.removed, result.skipped) == (6, 1, 2, 1, 1)
+    assert result.unchanged == 1 and result.written
+    doc = json.loads(dest.read_text())
+    assert doc["_readme"] == "hand-kept"
+    active = {r["mlsId"]: r for r in doc["active"]}
+    sold = {r["mlsId"]: r for r in doc["sold"]}
+    assert set(active) == {"MD1", "MD5"}
+    assert active["MD1"]["price"] == 389000 and active["MD1"]["imgUrl"] == "/oak.jpg"
+    assert active["MD5"]["id"] == 5 and active["MD5"]["city"] == "Columbia, MD 21044"
+    assert set(sold) == {"MD2", "MD4"}
+    assert sold["MD2"]["salePrice"] == 510000 and sold["MD2"]["soldDate"] == "Mar 2025"
+    assert "price" not in sold["MD2"]
+
+
+def test_address_matches_when_there_is_no_mls_number(tmp_path):
+    dest = _listings(tmp_path, active=[
+        {"id": 1, "address": "10 Main St.", "city": "Towson, MD 21204", "price": 400000},
+    ])
+    source = _export(tmp_path, ",Active,10 MAIN ST,Towson,MD,21204,410000,,,")
+    result = import_listings(str(source), str(dest))
+    assert (result.added, result.updated) == (0, 1)
+    assert [r["price"] for r in json.loads(dest.read_text())["active"]] == [410000]
+
+
+def test_dry_run_and_no_op_imports_leave_the_file_alone(tmp_path):
+    dest = _listings(tmp_path, active=[
+        {"id": 1, "mlsId": "MD1", "address": "1 Oak St", "city": "Towson, MD 21204", "price": 400000},
+    ])
+    before = dest.read_bytes()
+    mtime = dest.stat().st_mtime_ns
+
+    result = import_listings(str(_export(tmp_path, "MD1,Active,1 Oak St,,,,390000,,,")), str(dest),
+                             dry_run=True)
+    assert result.updated == 1 and not result.written
+    result = import_listings(str(_export(tmp_path, "MD1,Active,1 Oak St,,,,400000,,,")), str(dest))
+    assert result.unchanged == 1 and not result.written
+
+    assert dest.read_bytes() == before
+    assert dest.stat().st_mtime_ns == mtime
+
+
+def test_write_atomic_replaces_the_file_whole(tmp_path):
+    path = tmp_path / "listings.json"
+    path.write_text("{}")
+    os.chmod(path, 0o640)
+    inode = path.stat().st_ino
+
+    write_atomic(str(path), {"active": [{"address": "1 Oak St"}]})
+
+    assert json.loads(path.read_text()) == {"active": [{"address": "1 Oak St"}]}
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert path.stat().st_ino != inode  # a new file renamed over the old one
+    assert sorted(os.listdir(tmp_path)) == ["listings.json"]
+
+
+def test_write_atomic_failure_keeps_the_old_file(tmp_path):
+    path = tmp_path / "listings.json"
+    path.write_text('{"active": []}')
+    with pytest.raises(TypeError):
+        write_atomic(str(path), {"active": [object()]})
+    assert path.read_text() == '{"active": []}'
+    assert sorted(os.listdir(tmp_path)) == ["listings.json"]
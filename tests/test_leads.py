@@ -0,0 +1,175 @@
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from jungmarker_leads import (
+    LEAD_COLUMNS, MIGRATIONS, LeadStore, clean_lead, connect, decode_cursor, export_leads,
+    parse_time, query_leads,
+)
+
+
+def _version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _lead(**fields):
+    return clean_lead({"first_name": "Ann", "email": "ann@example.com", "interest": "buy", **fields})
+
+
+def _store(tmp_path, *leads, **kwargs):
+    store = LeadStore(str(tmp_path / "leads.db"), flush_interval=0.01, **kwargs)
+    for lead in leads:
+        store.submit(lead)
+    store.close()
+    return connect(store.path)
+
+
+# ── Migrations ───────────────────────────────────────────────────────────────
+
+def test_migrates_empty_database_to_current(tmp_path):
+    path = tmp_path / "leads.db"
+    path.touch()
+    conn = connect(str(path))
+    assert _version(conn) == len(MIGRATIONS)
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"leads", "people", "person_keys"} <= tables
+
+
+def test_migrates_v1_database_keeping_its_leads(tmp_path):
+    path = str(tmp_path / "leads.db")
+    old = sqlite3.connect(path)
+    old.executescript(f"{MIGRATIONS[0]}; PRAGMA user_version=1;")
+    old.execute(
+        "INSERT INTO leads (created_at, first_name, email, phone, interest) VALUES (?, ?, ?, ?, ?)",
+        ("2025-01-02T03:04:05.000+00:00", "Jo", "J.O+site@GoogleMail.com", "+1 (301) 555-0100",
+         "Selling my home"),
+    )
+    old.commit()
+    old.close()
+
+    conn = connect(path)
+    assert _version(conn) == len(MIGRATIONS)
+    row = conn.execute("SELECT * FROM leads").fetchone()
+    assert row["first_name"] == "Jo"
+    assert row["interest_code"] == "sell"
+    assert row["email_key"] == "jo@gmail.com"
+    assert row["phone_key"] == "3015550100"
+    assert row["agent"] == "" and row["zip"] == "" and row["person_id"] is None
+    # Reopening is a no-op.
+    assert _version(connect(path)) == len(MIGRATIONS)
+
+
+def _open(path, barrier, results):
+    barrier.wait()
+    try:
+        results.put(_version(connect(path)))
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_concurrent_opens_migrate_once(tmp_path):
+    path = str(tmp_path / "leads.db")
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(6), ctx.Queue()
+    procs = [ctx.Process(target=_open, args=(path, barrier, results)) for _ in range(6)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [results.get() for _ in procs] == [len(MIGRATIONS)] * len(procs)
+
+
+# ── Queries ──────────────────────────────────────────────────────────────────
+
+def test_keyset_pages_cover_every_lead_once(tmp_path):
+    conn = connect(str(tmp_path / "leads.db"))
+    stamps = ["2025-01-01T00:00:00.000+00:00"] * 4 + ["2025-01-02T00:00:00.000+00:00"] * 3
+    conn.executemany(
+        "INSERT INTO leads (created_at, first_name, interest_code) VALUES (?, ?, ?)",
+        [(ts, f"L{i}", "sell" if i % 2 else "buy") for i, ts in enumerate(stamps)],
+    )
+    conn.commit()
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = query_leads(conn, cursor=cursor, limit=3)
+        seen += [(r["created_at"], r["id"]) for r in rows]
+        if cursor is None:
+            break
+    assert seen == sorted(seen, reverse=True)
+    assert len(set(seen)) == len(stamps)
+
+    rows, _ = query_leads(conn, interest="sell", since=parse_time("2025-01-02"))
+    assert [r["first_name"] for r in rows] == ["L5"]
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+# ── Writer ───────────────────────────────────────────────────────────────────
+
+def test_writer_stores_leads_and_dead_letters_a_bad_one(tmp_path):
+    dead = tmp_path / "dead.jsonl"
+    conn = _store(
+        tmp_path, _lead(first_name="Ann"), {"first_name": "broken"}, _lead(first_name="Bob"),
+        max_attempts=1, dead_letter_path=str(dead),
+    )
+    assert [r[0] for r in conn.execute("SELECT first_name FROM leads ORDER BY id")] == ["Ann", "Bob"]
+    [record] = [json.loads(line) for line in dead.read_text().splitlines()]
+    assert record["lead"]["first_name"] == "broken"
+    assert "KeyError" in record["error"]
+
+
+# ── Export ───────────────────────────────────────────────────────────────────
+
+def _export(conn, *args, **kwargs):
+    path = conn.execute("PRAGMA database_list").fetchone()["file"]
+    return b"".join(export_leads(path, *args, **kwargs))
+
+
+def test_csv_export_neutralises_formulas_but_not_phone_numbers(tmp_path):
+    conn = _store(
+        tmp_path,
+        _lead(first_name="=HYPERLINK(\"http://x\",\"hi\")", phone="+1 (301) 555 0100",
+              message="@SUM(A1)"),
+        _lead(first_name="-2+3", last_name="+Plus", phone="-", message="plain, \"quoted\"\nline"),
+        _lead(first_name="-1-1", last_name="-(2)-3", phone="+1 301-555-0100", zip="-12"),
+        _lead(phone="301-555-0100"),
+    )
+    rows = list(csv.reader(io.StringIO(_export(conn).decode(), newline="")))
+    assert rows[0] == list(LEAD_COLUMNS)
+    first, second, third, fourth = (dict(zip(rows[0], row)) for row in rows[1:])
+    assert first["first_name"] == "'=HYPERLINK(\"http://x\",\"hi\")"
+    assert first["phone"] == "+1 (301) 555 0100"
+    assert first["message"] == "'@SUM(A1)"
+    assert second["first_name"] == "'-2+3"
+    assert second["last_name"] == "'+Plus"
+    assert second["message"] == "plain, \"quoted\"\nline"
+    # Only a lone number or phone shape is exempt; an operator after the
+    # first character makes it a formula again.
+    assert third["first_name"] == "'-1-1"
+    assert third["last_name"] == "'-(2)-3"
+    assert third["phone"] == "'+1 301-555-0100"
+    assert third["zip"] == "-12"
+    assert fourth["phone"] == "301-555-0100"
+
+
+def test_ndjson_export_is_verbatim_filtered_and_gzippable(tmp_path):
+    conn = _store(
+        tmp_path,
+        _lead(first_name="=1+1", interest="buy"),
+        _lead(first_name="Sal", interest="Selling my home"),
+    )
+    lines = _export(conn, "ndjson").decode().splitlines()
+    assert [json.loads(line)["first_name"] for line in lines] == ["=1+1", "Sal"]
+
+    body = gzip.decompress(_export(conn, "ndjson", True, interest="sell"))
+    assert [json.loads(line)["first_name"] for line in body.decode().splitlines()] == ["Sal"]
+    assert _export(conn, "ndjson", since=parse_time("2999-01-01")) == b""
@@ -0,0 +1,33 @@
+import json
+
+from jungmarker_listings import ListingSnapshot, SuggestIndex
+
+
+def _snapshot(active=(), sold=()):
+    data = json.dumps({"active": list(active), "sold": list(sold)}).encode()
+    return ListingSnapshot(data, 0, len(data))
+
+
+def _cities(matches):
+    return sorted(l.city for l in matches)
+
+
+def test_suggest_keeps_listings_with_missing_or_duplicate_ids():
+    snap = _snapshot(active=[
+        {"address": "1 Baylis St", "city": "Towson 21204", "price": 300000},
+        {"address": "2 Baylis St", "city": "Ruxton 21204", "price": 400000},
+        {"id": 7, "address": "3 Baylis St", "city": "Parkville 21234", "price": 500000},
+        {"id": 7, "address": "4 Baylis St", "city": "Catonsville 21228", "price": 600000},
+    ])
+    index = SuggestIndex()
+    index.sync(snap)
+    assert _cities(index.search("baylis")) == ["Catonsville 21228", "Parkville 21234",
+                                               "Ruxton 21204", "Towson 21204"]
+
+    # Dropping one duplicate leaves the other indexed.
+    index.sync(_snapshot(active=[
+        {"address": "2 Baylis St", "city": "Ruxton 21204", "price": 400000},
+        {"id": 7, "address": "4 Baylis St", "city": "Catonsville 21228", "price": 600000},
+    ]))
+    assert _cities(index.search("baylis")) == ["Catonsville 21228", "Ruxton 21204"]
+    assert _cities(index.search("baylis", min_price=500000)) == ["Catonsville 21228"]
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from jungmarker_leads import clean_lead
+from jungmarker_notify import CrmChannel, EmailChannel, PermanentError
+
+LEAD = {"first_name": "Ann", "last_name": "Lee", "email": "ann@example.com", "phone": "",
+        "interest": "buy", "message": ""}
+
+
+class _RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def request(self, method, path, body=b"", headers=None):
+        self.sent.append(time.monotonic())
+        return 201, {"records": [{}]}
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_crm_requests_are_spaced_by_the_budget(tmp_path, shared):
+    transport = _RecordingTransport()
+    rate_file = str(tmp_path / "airtable.rate") if shared else None
+    crm = CrmChannel(transport, "base", "table", requests_per_second=20, rate_file=rate_file)
+    for _ in range(6):
+        assert crm.send_batch([LEAD]) == [None]
+    gaps = [b - a for a, b in zip(transport.sent, transport.sent[1:])]
+    assert min(gaps) >= 0.045  # 1 / 20 s, less timer slack
+
+
+def test_line_breaks_never_reach_email_headers():
+    sent = []
+
+    class Transport:
+        def send(self, msg):
+            sent.append(msg)
+
+    email = EmailChannel(Transport(), "site@example.com")
+    email.send({**clean_lead({"first_name": "Ann\r\nBcc: x@example.com", "message": "a\nb"}),
+                "interest": "buy"})
+    assert sent[0]["Subject"] == "New Contact Form Lead — Ann Bcc: x@example.com (Buyer)"
+
+    with pytest.raises(PermanentError):
+        email.send({**LEAD, "last_name": "Lee\r\nBcc: x@example.com"})
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+import jungmarker_logging
+from jungmarker_site import app, minify_js
+
+TEMPLATE = """`
+    <li class="item">
+// not a comment: http://example.com
+      ${items.map(i => `<b>
+  ${i}   </b>`).join("")}
+
+    </li>   `"""
+
+
+def test_minify_js_keeps_template_literals_byte_for_byte():
+    js = f"""
+    // a comment
+    const url = "http://x"; /* block "with quotes'
+       still comment */
+    const html = {TEMPLATE};
+
+        render(html);   
+    """
+    assert minify_js(js) == "\n".join([
+        'const url = "http://x"; /* block "with quotes\'',
+        "still comment */",
+        f"const html = {TEMPLATE};",
+        "render(html);",
+    ])
+
+
+@pytest.mark.parametrize("query", [
+    "sqft=0", "sqft=-1200", "sqft=big", "beds=-1", "baths=-0.5", "baths=nan",
+])
+def test_cma_rejects_impossible_subjects(query):
+    resp = app.test_client().get(f"/api/cma?zip=21204&{query}")
+    assert resp.status_code == 400
+    assert resp.get_json()["ok"] is False
+
+
+def test_cma_accepts_a_plausible_subject():
+    resp = app.test_client().get("/api/cma?zip=21204&sqft=1800&beds=0&baths=2.5")
+    assert resp.status_code in (200, 404)  # 404: no sold comps in the listings file
+    if resp.status_code == 200:
+        assert resp.get_json()["subject"]["sqft"] == 1800
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test_contact_is_post_only(method):
+    resp = app.test_client().open("/contact", method=method)
+    assert resp.status_code == 405
+    assert resp.headers["Allow"] == "POST"
+
+
+def test_importing_the_site_leaves_root_logging_alone():
+    assert jungmarker_logging._configured is None
+    assert not any(isinstance(h, jungmarker_logging._AsyncHandler) for h in logging.getLogger().handlers)